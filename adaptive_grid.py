@@ -0,0 +1,139 @@
+from instance_catalog import create_catalog, get_election
+from create_pbc_csv import CSV_HEADER, calc_pbc_matrix, ordered_map
+from cost_matrix import create_cost_matrix
+from functools import partial
+from scipy.stats import norm
+import numpy as np
+import csv
+
+# greedy and MES statistic columns that are compared at every level
+COMPARED_COLUMNS = [
+    ('stat_val_greedy_budget', 'stat_val_MES_budget'),
+    ('stat_val_greedy_diff', 'stat_val_MES_diff'),
+]
+
+# spawn key of the cost seeds of the levels, election e uses (e, 0) and (e, 1) for its ballots and sweep costs
+LEVEL_KEY = 2
+
+
+#####
+# cost generator of one prop_prob level of election e
+# depends only on the seed, the election and the level, not on the other levels of the grid
+#####
+def level_rng(master_seed, e, prop_prob):
+    return np.random.default_rng(np.random.SeedSequence(master_seed, spawn_key=(e, LEVEL_KEY, int(round(prop_prob * 1e9)))))
+
+
+#####
+# csv rows of some levels of election e, var is the level id
+# the ballots are those of election e of the catalog, the costs of every level are drawn on their own
+#####
+def evaluate_levels(catalog, level_ids, prop_probs, e):
+    ballot_data = get_election(catalog, e)[0]
+    cost_matrix = np.array([
+        create_cost_matrix(catalog.budget, [prop_prob], catalog.num_projects, ballot_data.counts, catalog.num_votes, level_rng(catalog.seed, e, prop_prob))[0]
+        for prop_prob in prop_probs
+    ])
+    pbc = calc_pbc_matrix(ballot_data, cost_matrix, catalog.budget)
+
+    return [[var, prop_prob] + list(values) for var, prop_prob, values in zip(level_ids, prop_probs, pbc)]
+
+
+#####
+# mean and confidence interval of the columns of one level
+# values: elections x columns, nan values are left out
+#####
+def confidence_interval(values, confidence):
+    count = np.sum(~np.isnan(values), axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nanmean(values, axis=0) if len(values) else np.full(values.shape[1], np.nan)
+        se = np.where(count > 1, np.nanstd(values, axis=0, ddof=1) / np.sqrt(count), np.inf)
+    half = norm.ppf((1 + confidence) / 2) * se
+
+    return mean, mean - half, mean + half
+
+
+#####
+# what decides the refinement at one level, per pair of COMPARED_COLUMNS
+# difference: mean of MES - greedy (paired per election), overlap: whether the intervals of greedy and MES overlap
+#####
+def level_summary(values, confidence):
+    columns = CSV_HEADER[2:]
+    greedy = values[:, [columns.index(g) for g, m in COMPARED_COLUMNS]]
+    mes = values[:, [columns.index(m) for g, m in COMPARED_COLUMNS]]
+
+    with np.errstate(invalid='ignore'):
+        difference = np.nanmean(mes - greedy, axis=0)
+    greedy_mean, greedy_low, greedy_high = confidence_interval(greedy, confidence)
+    mes_mean, mes_low, mes_high = confidence_interval(mes, confidence)
+    overlap = (greedy_low <= mes_high) & (mes_low <= greedy_high)
+
+    return difference, overlap
+
+
+#####
+# new levels for a grid: the midpoints of neighbouring levels where the MES - greedy difference
+# changes by more than change_threshold, or where the greedy and MES intervals overlap at one level but not at the other
+# gaps that would get narrower than min_step are not split, the sharpest changes are split first
+#####
+def refinement_points(levels, summaries, change_threshold, min_step, max_new):
+    order = np.argsort(levels)
+    candidates = []
+
+    for a, b in zip(order[:-1], order[1:]):
+        if (levels[b] - levels[a]) / 2 < min_step:
+            continue
+        difference_a, overlap_a = summaries[a]
+        difference_b, overlap_b = summaries[b]
+        change = np.nan_to_num(np.abs(difference_b - difference_a))
+        if (change > change_threshold).any() or (overlap_a != overlap_b).any():
+            candidates.append((change.max(), (levels[a] + levels[b]) / 2))
+
+    candidates.sort(key=lambda candidate: -candidate[0])
+
+    return [round(float(level), 10) for change, level in candidates[:max_new]]
+
+
+#####
+# evaluates all elections of a catalog on a grid of prop_prob levels that is refined where it matters
+# starts from num_coarse levels evenly between prop_prob_low and prop_prob_high, then inserts midpoints
+# (see refinement_points) until nothing is left to split or max_levels levels are used
+# every election keeps its ballots on all levels, so the levels are compared on the same electorates
+# output_csv (optional) gets all rows in the format of create_pbc_csv, var is the level id and
+# prop_prob the actual probability of the level
+# returns the levels (index = var) and the per election values (levels x elections x statistic columns)
+#####
+def run_adaptive_grid(num_elections, num_votes, num_projects, budget, prop_prob_low=0, prop_prob_high=0.975, num_coarse=5,
+                      max_levels=40, min_step=0.0125, change_threshold=0.05, confidence=0.95,
+                      seed=None, num_workers=1, output_csv=None):
+    catalog = create_catalog(num_elections, num_votes, num_projects, budget, 0, seed=seed)
+    levels = []
+    values = []
+    summaries = []
+    new_levels = [round(float(level), 10) for level in np.linspace(prop_prob_low, prop_prob_high, num_coarse)]
+
+    csvfile = open(output_csv, 'w', newline='') if output_csv else None
+    if csvfile:
+        csv.writer(csvfile).writerow(CSV_HEADER)
+
+    try:
+        while new_levels:
+            level_ids = list(range(len(levels), len(levels) + len(new_levels)))
+            level_values = np.empty((len(new_levels), num_elections, len(CSV_HEADER) - 2))
+
+            for e, rows in enumerate(ordered_map(partial(evaluate_levels, catalog, level_ids, new_levels), range(num_elections), num_workers)):
+                level_values[:, e] = np.array(rows, dtype=float)[:, 2:]
+                if csvfile:
+                    csv.writer(csvfile).writerows(rows)
+
+            levels += new_levels
+            values += list(level_values)
+            summaries += [level_summary(level, confidence) for level in level_values]
+
+            print(len(levels), new_levels)
+            new_levels = refinement_points(np.array(levels), summaries, change_threshold, min_step, max_levels - len(levels))
+    finally:
+        if csvfile:
+            csvfile.close()
+
+    return np.array(levels), np.array(values)
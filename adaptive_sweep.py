@@ -0,0 +1,84 @@
+from instance_catalog import create_catalog, get_election
+from create_pbc_csv import CSV_HEADER, calc_pbc_matrix, ordered_map
+from pbc_aggregation import empty_aggregates, chunk_aggregates, merge_aggregates
+from functools import partial
+import numpy as np
+import csv
+
+STAT_COLUMNS = [column for column in CSV_HEADER if column.startswith('stat_val')]
+
+
+#####
+# csv rows of some variants of one election of a catalog
+#####
+def evaluate_variants(catalog, variants, e):
+    ballot_data, cost_matrix, meta = get_election(catalog, e)
+    pbc = calc_pbc_matrix(ballot_data, cost_matrix[variants], catalog.budget)
+
+    return [[var, meta['prop_prob_list'][var]] + list(values) for var, values in zip(variants, pbc)]
+
+
+#####
+# standard error of the mean per var and column
+# inf with a single value, nan without any (a statistic that is never defined does not hold the sweep up)
+#####
+def standard_errors(aggregates):
+    count = aggregates.count
+    with np.errstate(invalid='ignore', divide='ignore'):
+        se = np.sqrt(aggregates.m2 / (count - 1) / count)
+
+    return np.where(count == 1, np.inf, np.where(count == 0, np.nan, se))
+
+
+#####
+# variants whose standard error of any tracked column is still above target_se
+#####
+def open_variants(aggregates, num_profiles, columns, target_se):
+    se = standard_errors(aggregates)[:, [aggregates.columns.index(column) for column in columns]]
+    row_of = {int(var): row for row, var in enumerate(aggregates.vars)}
+
+    return [var for var in range(num_profiles) if var not in row_of or (se[row_of[var]] > target_se).any()]
+
+
+#####
+# generates and evaluates elections in batches until the mean of every tracked statistic
+# has a standard error of at most target_se for every prop_prob level (var)
+# a var that reached the target is not evaluated any more in later batches
+# at least min_elections and at most max_elections elections are used
+# output_csv (optional) gets all evaluated rows, in the format of create_pbc_csv
+# returns the aggregates (see pbc_aggregation), the number of elections and the catalog
+#####
+def run_until_precise(num_votes, num_projects, budget, num_profiles, prop_prob_start=1, prop_prob_step=0.025,
+                      target_se=0.01, columns=None, batch_size=10, min_elections=20, max_elections=10000,
+                      seed=None, num_workers=1, output_csv=None):
+    columns = STAT_COLUMNS if columns is None else columns
+    catalog = create_catalog(max_elections, num_votes, num_projects, budget, num_profiles, prop_prob_start, prop_prob_step, seed)
+    aggregates = empty_aggregates(CSV_HEADER[1:])
+
+    csvfile = open(output_csv, 'w', newline='') if output_csv else None
+    if csvfile:
+        csv.writer(csvfile).writerow(CSV_HEADER)
+
+    try:
+        num_elections = 0
+        while num_elections < max_elections:
+            variants = list(range(num_profiles))
+            if num_elections >= min_elections:
+                variants = open_variants(aggregates, num_profiles, columns, target_se)
+                if not variants:
+                    break
+
+            batch = range(num_elections, min(num_elections + batch_size, max_elections))
+            for rows in ordered_map(partial(evaluate_variants, catalog, variants), batch, num_workers):
+                rows = np.array(rows, dtype=float)
+                aggregates = merge_aggregates(aggregates, chunk_aggregates(rows[:, 0], rows[:, 1:], aggregates.columns))
+                if csvfile:
+                    csv.writer(csvfile).writerows([[int(row[0])] + list(row[1:]) for row in rows])
+            num_elections = batch.stop
+
+            print(num_elections, len(variants))
+    finally:
+        if csvfile:
+            csvfile.close()
+
+    return aggregates, num_elections, catalog
@@ -0,0 +1,148 @@
+from collections import namedtuple
+from mes_engine import default_project_names, mes_cost_sat
+from greedy_engine import greedy_cost_sat
+import jit_kernels
+import numpy as np
+
+
+#####
+# ballots of one election, shared by all cost variants
+# indptr/indices: approvals of every voter as a CSR matrix
+# types/multiplicities: deduplicated ballots, counts: approvals per project
+# all arrays are read-only, only the costs change between variants
+#####
+BallotData = namedtuple('BallotData', ['num_votes', 'project_names', 'indptr', 'indices', 'types', 'multiplicities', 'counts'])
+
+
+#####
+# approvals of every voter as a packed bitset, one row of ceil(num_projects / 8) bytes per voter
+# same bit order as np.packbits, filled block by block to keep the temporary arrays small
+#####
+def packed_approvals(indptr, indices, num_projects, block_size=1 << 16):
+
+    num_votes = len(indptr) - 1
+    packed = np.zeros((num_votes, (num_projects + 7) // 8), dtype=np.uint8)
+
+    for start in range(0, num_votes, block_size):
+        stop = min(start + block_size, num_votes)
+        projects = indices[indptr[start]:indptr[stop]]
+        voters = np.repeat(np.arange(start, stop), np.diff(indptr[start:stop + 1]))
+        np.bitwise_or.at(packed, (voters, projects >> 3), (128 >> (projects & 7)).astype(np.uint8))
+
+    return packed
+
+
+#####
+# deduplicated ballots from the packed bitset, same result as ballot_types on the boolean matrix
+# the bytes of a row sort like its bits, so the types come out in the same order
+#####
+def packed_ballot_types(packed, num_projects):
+
+    unique, multiplicities = np.unique(packed, axis=0, return_counts=True)
+    types = np.unpackbits(unique, axis=1, count=num_projects).astype(bool)
+
+    return types, multiplicities
+
+
+#####
+# builds the ballot data from a CSR approval matrix
+#####
+def ballot_data_from_csr(indptr, indices, num_projects, project_names=None):
+
+    if project_names is None:
+        project_names = default_project_names(num_projects)
+
+    indptr = np.asarray(indptr, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+    num_votes = len(indptr) - 1
+
+    if jit_kernels.enabled:
+        packed, counts = jit_kernels.pack_approvals(indptr, indices, num_projects)
+    else:
+        packed, counts = packed_approvals(indptr, indices, num_projects), np.bincount(indices, minlength=num_projects)
+    types, multiplicities = packed_ballot_types(packed, num_projects)
+
+    for array in (indptr, indices, types, multiplicities, counts):
+        array.flags.writeable = False
+
+    return BallotData(num_votes, tuple(project_names), indptr, indices, types, multiplicities, counts)
+
+
+#####
+# converts ballots given as collections of project indices to a CSR approval matrix
+# works through the ballots block by block, with free=True every block of
+# ballots is dropped from the list once it is converted
+#####
+def ballots_to_csr(ballots, free=False, block_size=1 << 16):
+
+    indptr = np.zeros(len(ballots) + 1, dtype=np.int64)
+    blocks = [np.zeros(0, dtype=np.int64)]
+
+    for start in range(0, len(ballots), block_size):
+        block = ballots[start:start + block_size]
+        if free:
+            ballots[start:start + block_size] = [None] * len(block)
+
+        lengths = [len(b) for b in block]
+        indptr[start + 1:start + 1 + len(block)] = lengths
+        blocks.append(np.fromiter((p for b in block for p in sorted(b)), dtype=np.int64, count=sum(lengths)))
+        del block
+
+    np.cumsum(indptr, out=indptr)
+
+    return indptr, np.concatenate(blocks)
+
+
+#####
+# builds the ballot data from ballots given as collections of project indices
+# e.g. the output of prefsampling
+#####
+def create_ballot_data(ballots, num_projects, project_names=None):
+
+    indptr, indices = ballots_to_csr(ballots)
+
+    return ballot_data_from_csr(indptr, indices, num_projects, project_names)
+
+
+#####
+# builds the ballot data from a pabutools profile or multiprofile
+# project_names gives the column order, e.g. list(instance.project_meta)
+#####
+def ballot_data_from_profile(profile, project_names):
+
+    index = {name: i for i, name in enumerate(project_names)}
+    ballots = []
+
+    for ballot in profile:
+        approved = [index[project.name] for project in ballot]
+        ballots.extend([approved] * profile.multiplicity(ballot))
+
+    return create_ballot_data(ballots, len(project_names), project_names)
+
+
+#####
+# boolean array of the selected projects
+#####
+def selection_mask(selected, num_projects):
+
+    mask = np.zeros(num_projects, dtype=bool)
+    mask[list(selected)] = True
+
+    return mask
+
+
+#####
+# MES outcome for one cost vector, same settings as the analysis scripts
+#####
+def mes_outcome(ballot_data, costs, budget_limit, voter_budget_increment=1):
+
+    selected = mes_cost_sat(ballot_data.types, ballot_data.multiplicities, costs, budget_limit, ballot_data.project_names, voter_budget_increment)
+
+    return selection_mask(selected, len(ballot_data.project_names))
+
+
+#####
+# greedy outcomes for all cost variants, one row per variant
+#####
+def greedy_outcomes(ballot_data, cost_matrix, budget_limit):
+    return greedy_cost_sat(ballot_data.counts, cost_matrix, budget_limit, ballot_data.project_names)
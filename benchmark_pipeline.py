@@ -0,0 +1,263 @@
+from create_many_instances import create_ballots, create_ballot_arrays, create_cost_instance, create_profile
+from cost_matrix import create_prop_probs, create_cost_matrix, create_instance_from_costs
+from ballot_data import create_ballot_data, mes_outcome, greedy_outcomes
+from create_pbc_csv import pbc_from_outcomes
+from histogram_rendering import render_all
+from pabutools.election import write_pabulib, parse_pabulib
+from importlib import metadata
+import scipy.stats as stats
+import numpy as np
+import tempfile
+import tracemalloc
+import platform
+import argparse
+import random
+import time
+import json
+import os
+
+# every stage of the pipeline, in pipeline order
+STAGES = [
+    'create_ballots', 'create_ballot_arrays', 'create_cost_instance', 'create_profile',
+    'write_pabulib', 'parse_pabulib', 'mes', 'greedy', 'pointbiserial', 'pointbiserial_batched', 'render_histograms',
+]
+
+# voters x projects x variants per election of the sweeps, "full" takes hours
+SWEEPS = {
+    'quick': {'num_votes': [1000, 10000], 'num_projects': [20, 100], 'num_variants': [10]},
+    'full': {'num_votes': [1000, 10000, 100000, 1000000], 'num_projects': [20, 100, 500], 'num_variants': [10, 40]},
+}
+
+# packages whose upgrades the baseline should show
+PACKAGES = ['numpy', 'scipy', 'matplotlib', 'pabutools', 'prefsampling']
+
+
+#####
+# inputs of the stages of one case, each built on first use and outside the measurement
+# returns a getter by name
+#####
+def case_inputs(num_votes, num_projects, num_variants, budget, seed, folder):
+    inputs = {}
+    builders = {
+        'ballots': lambda: create_ballots(num_votes, num_projects, seed),
+        'ballot_data': lambda: create_ballot_data(get('ballots')[0], num_projects),
+        'prop_probs': lambda: create_prop_probs(num_variants, 1, 1 / num_variants),
+        'cost_matrix': lambda: create_cost_matrix(budget, get('prop_probs'), num_projects, get('ballot_data').counts, num_votes, np.random.default_rng(seed)),
+        'instance': lambda: create_instance_from_costs(budget, get('cost_matrix')[0]),
+        'profile': lambda: create_profile(get('ballots')[0], get('instance')),
+        'pabulib_file': lambda: write_file(get('instance'), get('profile'), os.path.join(folder, 'instance.pb')),
+        'in_outcome_MES': lambda: np.array([mes_outcome(get('ballot_data'), costs, budget) for costs in get('cost_matrix')]),
+        'in_outcome_greedy': lambda: greedy_outcomes(get('ballot_data'), get('cost_matrix'), budget),
+    }
+
+    def get(name):
+        if name not in inputs:
+            inputs[name] = builders[name]()
+        return inputs[name]
+
+    return get
+
+
+#####
+# writes an instance and returns the file name
+#####
+def write_file(instance, profile, file):
+    write_pabulib(instance, profile, file)
+
+    return file
+
+
+#####
+# the pbc values of all variants with one scipy.stats.pointbiserialr call per statistic and variant,
+# the way create_pbc_csv computed them before pbc_engine
+#####
+def scipy_pbc(ballot_data, cost_matrix, budget, in_outcome_MES, in_outcome_greedy):
+    votes_perc = ballot_data.counts / ballot_data.num_votes
+    rows = []
+    for costs, outcome_MES, outcome_greedy in zip(cost_matrix, in_outcome_MES, in_outcome_greedy):
+        budget_perc = costs / budget
+        diff = budget_perc - votes_perc
+        rows.append(
+            tuple(stats.pointbiserialr(outcome_greedy, budget_perc)) + tuple(stats.pointbiserialr(outcome_MES, budget_perc)) +
+            tuple(stats.pointbiserialr(outcome_greedy, diff)) + tuple(stats.pointbiserialr(outcome_MES, diff))
+        )
+
+    return rows
+
+
+#####
+# the function that is measured for a stage, its inputs are built before
+# the generation and solving stages cover all variants of one election, the file stages one instance
+#####
+def stage_function(stage, get, num_votes, num_projects, num_variants, budget, seed, folder):
+    if stage == 'create_ballots':
+        return lambda: create_ballots(num_votes, num_projects, seed)
+    if stage == 'create_ballot_arrays':
+        return lambda: create_ballot_arrays(num_votes, num_projects, seed)
+    if stage == 'create_cost_instance':
+        sorted_counts, prop_probs = get('ballots')[1], get('prop_probs')
+        counts = {p: sorted_counts.get(p, 0) for p in range(num_projects)}
+        return lambda: [create_cost_instance(budget, prop_prob, num_projects, counts, num_votes) for prop_prob in prop_probs]
+    if stage == 'create_profile':
+        ballots, instance = get('ballots')[0], get('instance')
+        return lambda: create_profile(ballots, instance)
+    if stage == 'write_pabulib':
+        instance, profile = get('instance'), get('profile')
+        return lambda: write_pabulib(instance, profile, os.path.join(folder, 'written.pb'))
+    if stage == 'parse_pabulib':
+        file = get('pabulib_file')
+        return lambda: parse_pabulib(file)
+    if stage == 'mes':
+        ballot_data, cost_matrix = get('ballot_data'), get('cost_matrix')
+        return lambda: [mes_outcome(ballot_data, costs, budget) for costs in cost_matrix]
+    if stage == 'greedy':
+        ballot_data, cost_matrix = get('ballot_data'), get('cost_matrix')
+        return lambda: greedy_outcomes(ballot_data, cost_matrix, budget)
+    if stage in ('pointbiserial', 'pointbiserial_batched'):
+        ballot_data, cost_matrix, in_outcome_MES, in_outcome_greedy = get('ballot_data'), get('cost_matrix'), get('in_outcome_MES'), get('in_outcome_greedy')
+        pbc = scipy_pbc if stage == 'pointbiserial' else pbc_from_outcomes
+        return lambda: pbc(ballot_data, cost_matrix, budget, in_outcome_MES, in_outcome_greedy)
+    if stage == 'render_histograms':
+        ballot_data, cost_matrix = get('ballot_data'), get('cost_matrix')
+        save_names = [os.path.join(folder, f'histogram_{var}.png') for var in range(num_variants)]
+        return lambda: render_all(ballot_data.counts, cost_matrix, num_votes, budget, save_names)
+
+    raise ValueError(f"unknown stage {stage}")
+
+
+#####
+# wall time (best of repeat runs) and peak memory of one function
+# the memory is measured in an extra run with tracemalloc, so it does not slow down the timed runs
+# peak_bytes is what the function allocates on top of its inputs
+#####
+def measure(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return min(times), peak
+
+
+#####
+# versions and machine of a benchmark run
+#####
+def environment():
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'system': platform.platform(), 'packages': versions}
+
+
+#####
+# runs the stages on all cases of a sweep (a name of SWEEPS or a dict of the same form)
+# a stage that fails gets its error recorded instead of the measurements, the others still run
+# returns the results, also written to output_json if given
+#####
+def run_benchmarks(sweep='quick', stages=None, repeat=3, budget=500000, seed=0, output_json=None):
+    sweep = SWEEPS[sweep] if isinstance(sweep, str) else sweep
+    stages = STAGES if stages is None else stages
+    results = []
+
+    for num_votes in sweep['num_votes']:
+        for num_projects in sweep['num_projects']:
+            for num_variants in sweep['num_variants']:
+                # create_cost_instance draws from the global generators
+                random.seed(seed)
+                np.random.seed(seed)
+
+                with tempfile.TemporaryDirectory() as folder:
+                    get = case_inputs(num_votes, num_projects, num_variants, budget, seed, folder)
+                    for stage in stages:
+                        result = {'stage': stage, 'num_votes': num_votes, 'num_projects': num_projects, 'num_variants': num_variants}
+                        try:
+                            function = stage_function(stage, get, num_votes, num_projects, num_variants, budget, seed, folder)
+                            result['seconds'], result['peak_bytes'] = measure(function, repeat)
+                        except Exception as error:
+                            result['error'] = f"{type(error).__name__}: {error}"
+                        results.append(result)
+                        print(result)
+
+    benchmark = {'environment': environment(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': repeat, 'results': results}
+    if output_json:
+        with open(output_json, 'w') as file:
+            json.dump(benchmark, file, indent=1)
+
+    return benchmark
+
+
+#####
+# compares a benchmark run with a baseline (both as returned by run_benchmarks)
+# flags every stage and case that got slower or needs more memory by more than threshold (0.2 = 20%)
+# times below min_seconds in both runs are too noisy to compare, stages that fail now but did not are always flagged
+# returns the list of regressions
+#####
+def compare_benchmarks(baseline, current, threshold=0.2, memory_threshold=None, min_seconds=0.005):
+    memory_threshold = threshold if memory_threshold is None else memory_threshold
+    key = lambda result: (result['stage'], result['num_votes'], result['num_projects'], result['num_variants'])
+    old_results = {key(result): result for result in baseline['results']}
+    regressions = []
+
+    for new in current['results']:
+        old = old_results.get(key(new))
+        if old is None or 'error' in old:
+            continue
+        if 'error' in new:
+            regressions.append({'case': key(new), 'metric': 'error', 'old': None, 'new': new['error']})
+            continue
+
+        if max(old['seconds'], new['seconds']) >= min_seconds and new['seconds'] > old['seconds'] * (1 + threshold):
+            regressions.append({'case': key(new), 'metric': 'seconds', 'old': old['seconds'], 'new': new['seconds']})
+        if new['peak_bytes'] > old['peak_bytes'] * (1 + memory_threshold):
+            regressions.append({'case': key(new), 'metric': 'peak_bytes', 'old': old['peak_bytes'], 'new': new['peak_bytes']})
+
+    return regressions
+
+
+#####
+# runs a sweep and writes it as the new baseline, or compares it with a baseline (--compare)
+# with --compare the run is only written if --output is given, and never over the baseline
+# exits with 1 if there are regressions
+#####
+def main(args=None):
+    parser = argparse.ArgumentParser(description="benchmarks of the stages of the simulation pipeline")
+    parser.add_argument('--sweep', default='quick', choices=sorted(SWEEPS))
+    parser.add_argument('--stages', nargs='+', choices=STAGES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="where the results are written, benchmark_baseline.json without --compare")
+    parser.add_argument('--compare', help="baseline json to compare the results with")
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(args)
+
+    if not args.compare:
+        run_benchmarks(args.sweep, args.stages, args.repeat, seed=args.seed, output_json=args.output or 'benchmark_baseline.json')
+        return 0
+    if args.output and os.path.abspath(args.output) == os.path.abspath(args.compare):
+        parser.error("--output would overwrite the --compare baseline")
+
+    with open(args.compare) as file:
+        baseline = json.load(file)
+
+    current = run_benchmarks(args.sweep, args.stages, args.repeat, seed=args.seed, output_json=args.output)
+    regressions = compare_benchmarks(baseline, current, args.threshold)
+    for regression in regressions:
+        print("regression", regression)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
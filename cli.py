@@ -0,0 +1,197 @@
+import argparse
+import os
+
+CACHE_DIR_HELP = "folder of the outcome cache, reruns then skip the solved elections (off by default)"
+
+# the heavy modules (numpy, scipy, pandas, matplotlib, pabutools, prefsampling) are only imported
+# inside the subcommand that needs them, so e.g. evaluate never loads matplotlib or prefsampling
+
+
+#####
+# --cache-dir switches the outcome cache on (see outcome_cache)
+# it goes through the environment, so it is set before outcome_cache is imported and pool workers inherit it
+#####
+def use_cache_dir(args):
+    if args.cache_dir:
+        os.environ["OUTCOME_CACHE_DIR"] = os.path.expanduser(args.cache_dir)
+
+
+#####
+# generate: elections with num_profiles cost variants each, see create_many_instances.make_instances
+#####
+def generate(args):
+    from create_many_instances import make_instances
+
+    master_seed = make_instances(
+        num_elections=args.num_elections, num_votes=args.num_votes, num_projects=args.num_projects, budget=args.budget,
+        num_profiles=args.num_profiles, prop_prob_start=args.prop_prob_start, prop_prob_step=args.prop_prob_step,
+        output_format=args.format, seed=args.seed, num_workers=args.workers, folder=args.folder, ballot_chunk_size=args.ballot_chunk_size,
+    )
+    print("seed", master_seed)
+
+
+#####
+# evaluate: pbc csv of a folder of instance files or of an election store
+#####
+def evaluate(args):
+    use_cache_dir(args)
+    from create_pbc_csv import process_election_instances, process_election_store
+
+    process = process_election_store if args.store else process_election_instances
+    process(args.folder, args.output_csv, num_workers=args.workers, max_in_flight=args.max_in_flight, resume=args.resume,
+            instrument=args.instrument, profile_file=args.profile, checkpoint=args.checkpoint)
+
+
+#####
+# plot: pbc plots and summary of a results csv
+#####
+def plot(args):
+    from create_pbc_plots import plot_pbc_from_csv
+
+    os.makedirs(args.output_folder, exist_ok=True)
+    plot_pbc_from_csv(args.csv_file, args.output_folder, chunksize=args.chunksize, num_resamples=args.resamples, confidence=args.confidence, seed=args.seed)
+
+
+#####
+# real-costs: cost and cost/budget histograms of the pabulib files of a folder
+#####
+def real_costs(args):
+    use_cache_dir(args)
+    from corpus_analysis import analyse_corpus, cost_distribution_metric
+    import cost_distr_real
+
+    output_dir = args.output_dir or args.folder
+    os.makedirs(output_dir, exist_ok=True)
+    costs, costs_budget = analyse_corpus(args.folder, [cost_distribution_metric()], args.workers)['cost_distribution']
+    cost_distr_real.plot_histogram(costs, 'Project Costs', "cost_distribution.png", output_dir, False)
+    cost_distr_real.plot_histogram(costs_budget, 'Project Cost/Budget', "cost_budget_distribution.png", output_dir, True)
+
+
+#####
+# popularity: votes/possible approvals of the projects greedy and MES select in the pabulib files of a folder
+#####
+def popularity(args):
+    use_cache_dir(args)
+    from corpus_analysis import analyse_corpus, popularity_metric
+    import sel_pop_stat
+
+    output_dir = args.output_dir or args.folder
+    os.makedirs(output_dir, exist_ok=True)
+    ratio_sel_greedy, ratio_sel_MES = analyse_corpus(args.folder, [popularity_metric()], args.workers)['popularity']
+    sel_pop_stat.plot_histogram(ratio_sel_greedy, ratio_sel_MES, output_dir)
+
+
+#####
+# shards: split a sweep into a manifest, work on its shards (on any node) and merge the results, see shard_manifest
+#####
+def shards(args):
+    import shard_manifest
+
+    if args.action == 'split':
+        manifest = shard_manifest.create_manifest(
+            args.folder, args.num_elections, args.shard_size, args.num_votes, args.num_projects, args.budget, args.num_profiles,
+            args.prop_prob_start, args.prop_prob_step, args.seed, args.ballot_chunk_size,
+        )
+        print(len(manifest['shards']), "shards, seed", manifest['catalog']['seed'])
+    elif args.action == 'work':
+        shard_manifest.run_worker(args.folder, args.worker, args.lease_seconds, args.workers, args.max_shards, args.wait, args.poll_seconds)
+    else:
+        shard_manifest.merge_shards(args.folder, args.output, args.format)
+
+
+#####
+# argument parser of all subcommands, the defaults are those of the original scripts
+#####
+def create_parser():
+    parser = argparse.ArgumentParser(description="cost bias in participatory budgeting: generation, evaluation and plots")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('generate', help="generate elections with cost variants")
+    p.add_argument('--num-elections', type=int, default=100)
+    p.add_argument('--num-votes', type=int, default=1000)
+    p.add_argument('--num-projects', type=int, default=20)
+    p.add_argument('--budget', type=int, default=500000)
+    p.add_argument('--num-profiles', type=int, default=40, help="cost variants per election")
+    p.add_argument('--prop-prob-start', type=float, default=1)
+    p.add_argument('--prop-prob-step', type=float, default=0.025)
+    p.add_argument('--format', choices=["pabulib", "store"], default="pabulib")
+    p.add_argument('--seed', type=int, help="master seed, drawn if not given")
+    p.add_argument('--workers', type=int, default=1)
+    p.add_argument('--folder', help="output folder, instances/ or instances_store/ by default")
+    p.add_argument('--ballot-chunk-size', type=int)
+    p.set_defaults(run=generate)
+
+    p = subparsers.add_parser('evaluate', help="write the pbc csv of generated elections")
+    p.add_argument('folder', help="folder of instance_<e>_<var>.pb files, or an election store with --store")
+    p.add_argument('output_csv')
+    p.add_argument('--store', action='store_true', help="the folder is an election store")
+    p.add_argument('--workers', type=int, default=1)
+    p.add_argument('--max-in-flight', type=int)
+    p.add_argument('--checkpoint', action='store_true', help="keep a checkpoint so the run can be resumed")
+    p.add_argument('--resume', action='store_true', help="continue an interrupted run")
+    p.add_argument('--instrument', help="json lines file for timing and memory events")
+    p.add_argument('--profile', help="cProfile dump file")
+    p.add_argument('--cache-dir', help=CACHE_DIR_HELP)
+    p.set_defaults(run=evaluate)
+
+    p = subparsers.add_parser('plot', help="plot a pbc csv")
+    p.add_argument('csv_file')
+    p.add_argument('output_folder')
+    p.add_argument('--chunksize', type=int, default=1_000_000)
+    p.add_argument('--resamples', type=int, default=1000, help="bootstrap resamples for confidence bands, 0 turns the bands off")
+    p.add_argument('--confidence', type=float, default=0.95)
+    p.add_argument('--seed', type=int)
+    p.set_defaults(run=plot)
+
+    p = subparsers.add_parser('real-costs', help="cost distribution of real pabulib files")
+    p.add_argument('folder')
+    p.add_argument('--output-dir', help="the folder itself by default")
+    p.add_argument('--workers', type=int, default=1)
+    p.add_argument('--cache-dir', help=CACHE_DIR_HELP)
+    p.set_defaults(run=real_costs)
+
+    p = subparsers.add_parser('popularity', help="popularity of the projects selected by greedy and MES in real pabulib files")
+    p.add_argument('folder')
+    p.add_argument('--output-dir', help="the folder itself by default")
+    p.add_argument('--workers', type=int, default=1)
+    p.add_argument('--cache-dir', help=CACHE_DIR_HELP)
+    p.set_defaults(run=popularity)
+
+    p = subparsers.add_parser('shards', help="sweeps split into shards for workers on a shared filesystem")
+    shard_parsers = p.add_subparsers(dest='action', required=True)
+    q = shard_parsers.add_parser('split', help="write the manifest of a sweep")
+    q.add_argument('folder')
+    q.add_argument('--num-elections', type=int, default=100)
+    q.add_argument('--shard-size', type=int, default=10, help="elections per shard")
+    q.add_argument('--num-votes', type=int, default=1000)
+    q.add_argument('--num-projects', type=int, default=20)
+    q.add_argument('--budget', type=int, default=500000)
+    q.add_argument('--num-profiles', type=int, default=40)
+    q.add_argument('--prop-prob-start', type=float, default=1)
+    q.add_argument('--prop-prob-step', type=float, default=0.025)
+    q.add_argument('--seed', type=int, help="master seed, drawn if not given")
+    q.add_argument('--ballot-chunk-size', type=int)
+    q = shard_parsers.add_parser('work', help="claim and evaluate shards")
+    q.add_argument('folder')
+    q.add_argument('--worker', help="name in the lock files, host-pid by default")
+    q.add_argument('--lease-seconds', type=float, default=600)
+    q.add_argument('--workers', type=int, default=1, help="processes per shard")
+    q.add_argument('--max-shards', type=int)
+    q.add_argument('--wait', action='store_true', help="wait for shards leased by other workers")
+    q.add_argument('--poll-seconds', type=float, default=30)
+    q = shard_parsers.add_parser('merge', help="combine the shard results")
+    q.add_argument('folder')
+    q.add_argument('output')
+    q.add_argument('--format', choices=["csv", "npz"], default="csv")
+    p.set_defaults(run=shards)
+
+    return parser
+
+
+def main(args=None):
+    args = create_parser().parse_args(args)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+from collections import namedtuple
+from functools import partial
+from pb_stream import read_pabulib, load_ballot_data, selected_ratio
+from outcome_cache import cached_mes_outcomes, cached_greedy_outcomes
+from create_pbc_csv import CSV_HEADER, ordered_map, pbc_from_outcomes, prop_prob_of
+import numpy as np
+import csv
+import os
+import re
+
+INSTANCE_FILE = re.compile(r"instance_(\d+)_(\d+)\.pb$")
+
+#####
+# everything the metrics get for one election, read and solved once
+# files/headers: the pabulib files of the variants and their header data (pb_stream arrays without votes)
+# ballot_data: the ballots, cost_matrix: variants x projects, in_outcome_*: variants x projects selection masks
+# ballot_data and the outcomes are None if no metric needs them
+#####
+ElectionRecord = namedtuple('ElectionRecord', ['files', 'headers', 'ballot_data', 'cost_matrix', 'budget', 'in_outcome_MES', 'in_outcome_greedy'])
+
+#####
+# a metric consumer
+# add(record) is called for every election in file order, result() returns what was collected
+# needs_outcomes=False lets the pipeline skip the rules if no metric needs them,
+# needs_ballots=False also skips parsing the ballots (only the headers are read)
+#####
+Metric = namedtuple('Metric', ['name', 'add', 'result', 'needs_outcomes', 'needs_ballots'])
+
+
+#####
+# groups the sorted .pb files of a folder by election
+# only generated instance_<e>_<var>.pb files share ballots, any other file is an election of its own
+#####
+def election_groups(folder_path):
+    files = sorted(f for f in os.listdir(folder_path) if f.endswith('.pb'))
+    groups = []
+    last = None
+
+    for file in files:
+        match = INSTANCE_FILE.match(file)
+        election = match.group(1) if match else None
+        if election is not None and election == last:
+            groups[-1].append(file)
+        else:
+            groups.append([file])
+        last = election
+
+    return groups
+
+
+#####
+# reads the files of one election once and runs both rules once on all variants
+# the ballots are parsed from the first file, for the others only the header is read
+# with_ballots=False reads only the headers of all files (and implies with_outcomes=False)
+#####
+def read_election(folder_path, files, with_outcomes=True, with_ballots=True):
+    if with_ballots:
+        ballot_data, first = load_ballot_data(os.path.join(folder_path, files[0]))
+    else:
+        ballot_data, first = None, read_pabulib(os.path.join(folder_path, files[0]), header_only=True)
+    headers = [first] + [read_pabulib(os.path.join(folder_path, file), header_only=True) for file in files[1:]]
+    cost_matrix = np.array([header.costs for header in headers])
+    budget = first.budget
+
+    in_outcome_MES = in_outcome_greedy = None
+    if with_outcomes and with_ballots:
+        in_outcome_MES = cached_mes_outcomes(ballot_data, cost_matrix, budget)
+        in_outcome_greedy = cached_greedy_outcomes(ballot_data, cost_matrix, budget)
+
+    return ElectionRecord(files, headers, ballot_data, cost_matrix, budget, in_outcome_MES, in_outcome_greedy)
+
+
+#####
+# walks a folder once and feeds every election to all metrics
+# num_workers > 1 reads and solves the elections in a process pool, metrics still see them in file order
+# returns the results by metric name
+#####
+def analyse_corpus(folder_path, metrics, num_workers=1, max_in_flight=None):
+    with_outcomes = any(metric.needs_outcomes for metric in metrics)
+    with_ballots = with_outcomes or any(metric.needs_ballots for metric in metrics)
+    groups = election_groups(folder_path)
+
+    read = partial(read_election, folder_path, with_outcomes=with_outcomes, with_ballots=with_ballots)
+    records = ordered_map(read, groups, num_workers, max_in_flight)
+    for record in records:
+        for metric in metrics:
+            metric.add(record)
+
+    return {metric.name: metric.result() for metric in metrics}
+
+
+#####
+# costs and costs/budget of all projects, as cost_distr_real.fill_arrays
+#####
+def cost_distribution_metric():
+    costs = []
+    costs_budget = []
+
+    def add(record):
+        for header in record.headers:
+            for cost in header.costs:
+                costs.append(int(cost))
+                costs_budget.append(int(cost)/int(header.budget))
+
+    return Metric('cost_distribution', add, lambda: (costs, costs_budget), False, False)
+
+
+#####
+# votes/possible approvals of the selected projects for greedy and MES, as sel_pop_stat.sel_popular
+# needs the votes column of the projects section (real pabulib files)
+#####
+def popularity_metric():
+    ratio_sel_greedy = []
+    ratio_sel_MES = []
+
+    def add(record):
+        for var, header in enumerate(record.headers):
+            selected_ratio(header, record.in_outcome_greedy[var], ratio_sel_greedy)
+            selected_ratio(header, record.in_outcome_MES[var], ratio_sel_MES)
+
+    return Metric('popularity', add, lambda: (ratio_sel_greedy, ratio_sel_MES), True, True)
+
+
+#####
+# pbc csv rows of all instances, as create_pbc_csv.process_election_instances
+#####
+def pbc_metric():
+    rows = []
+
+    def add(record):
+        pbc = pbc_from_outcomes(record.ballot_data, record.cost_matrix, record.budget, record.in_outcome_MES, record.in_outcome_greedy)
+        for file, header, values in zip(record.files, record.headers, pbc):
+            rows.append([file.split('_')[-1].split('.')[0], prop_prob_of(header.meta)] + list(values))
+
+    return Metric('pbc', add, lambda: rows, True, True)
+
+
+#####
+# data of the per instance histograms of stats_with_instance_plotting.histogramm
+# percentages of the votes and of the budget of every project and their differences
+#####
+def histogram_metric():
+    histograms = []
+
+    def add(record):
+        votes_perc = record.ballot_data.counts / record.ballot_data.num_votes * 100
+        for file, costs in zip(record.files, record.cost_matrix):
+            budget_perc = costs / record.budget * 100
+            histograms.append({'file': file, 'votes_perc': votes_perc, 'budget_perc': budget_perc, 'differences': budget_perc - votes_perc})
+
+    return Metric('histograms', add, lambda: histograms, False, True)
+
+
+#####
+# runs all analyses on one folder in a single pass
+# writes the pbc csv, the popularity histogram and the cost distribution histograms
+# the popularity needs real pabulib files (votes column), leave it out with popularity=False
+#####
+def run_all_analyses(folder_path, output_csv, output_dir, popularity=True, num_workers=1, max_in_flight=None):
+    # the plotting modules load matplotlib and pabutools, the pass itself (and its workers) does not need them
+    import sel_pop_stat
+    import cost_distr_real
+
+    metrics = [cost_distribution_metric(), pbc_metric(), histogram_metric()]
+    if popularity:
+        metrics.append(popularity_metric())
+
+    results = analyse_corpus(folder_path, metrics, num_workers, max_in_flight)
+    os.makedirs(output_dir, exist_ok=True)
+
+    with open(output_csv, 'w', newline='') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(CSV_HEADER)
+        csvwriter.writerows(results['pbc'])
+
+    costs, costs_budget = results['cost_distribution']
+    cost_distr_real.plot_histogram(costs, 'Project Costs', "cost_distribution.png", output_dir, False)
+    cost_distr_real.plot_histogram(costs_budget, 'Project Cost/Budget', "cost_budget_distribution.png", output_dir, True)
+
+    if popularity:
+        ratio_sel_greedy, ratio_sel_MES = results['popularity']
+        sel_pop_stat.plot_histogram(ratio_sel_greedy, ratio_sel_MES, output_dir)
+
+    return results
@@ -5,6 +5,7 @@ from collections import defaultdict
 import os
 import matplotlib.pyplot as plt
 import numpy as np
+from pb_stream import read_pabulib
 
 #####
 # loads instance from pb-file
@@ -17,13 +18,14 @@ def load_instance(file):
 
 #####
 # returns lists of costs and percentage of budget that cost is
+# only the header of the file is read, the votes are skipped
 #####
 def fill_arrays(file_path, costs, costs_budget):
-    instance, profile = load_instance(file_path)
+    arrays = read_pabulib(file_path, header_only=True)
 
-    for p in instance:
-        costs.append(int(instance.project_meta[p]['cost']))
-        costs_budget.append(int(instance.project_meta[p]['cost'])/int(instance.budget_limit))
+    for cost in arrays.costs:
+        costs.append(int(cost))
+        costs_budget.append(int(cost)/int(arrays.budget))
 
     return costs, costs_budget
 
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+#####
+# proportionality probabilities of a sweep
+# same repeated subtraction as create_list_cost_instances, not rounded
+#####
+def create_prop_probs(num_instances, prop_prob_start, prop_prob_step):
+
+    prop_probs = np.empty(num_instances)
+    prop_prob = prop_prob_start
+
+    for i in range(num_instances):
+        prop_prob = prop_prob - prop_prob_step
+        prop_probs[i] = prop_prob
+
+    return prop_probs
+
+
+#####
+# approval counts as an array with one entry per project
+# projects without any approval get a count of 0
+#####
+def counts_array(sorted_counts, num_projects):
+
+    if isinstance(sorted_counts, dict):
+        return np.array([sorted_counts.get(p, 0) for p in range(num_projects)], dtype=np.int64)
+
+    return np.asarray(sorted_counts, dtype=np.int64)
+
+
+#####
+# cost of every project if it was exactly proportional to its votes
+#####
+def calc_prop_costs(budget, sorted_counts, num_projects, num_votes):
+
+    counts = counts_array(sorted_counts, num_projects)
+
+    return ((counts / num_votes) * budget).astype(np.int64)
+
+
+#####
+# creates the costs of all instances of one election in a single draw
+# one row per proportionality probability, one column per project
+# same distribution as create_cost_instance
+# without rng the global numpy random state is used, so np.random.seed still applies
+#####
+def create_cost_matrix(budget, prop_probs, num_projects, sorted_counts, num_votes, rng=None):
+
+    if rng is None:
+        rng = np.random
+
+    prop_probs = np.asarray(prop_probs, dtype=float)
+    prop_costs = calc_prop_costs(budget, sorted_counts, num_projects, num_votes)
+    shape = (len(prop_probs), num_projects)
+
+    higher = rng.random(shape) > prop_probs[:, None]
+
+    mu = prop_costs + (budget - prop_costs) / 2  # Mean of the normal distribution
+    sigma = 20000  # Standard deviation of the normal distribution
+    random_numbers = rng.normal(mu, sigma, shape)
+    higher_costs = np.clip(np.rint(random_numbers), prop_costs, budget).astype(np.int64)
+
+    return np.where(higher, higher_costs, prop_costs)
+
+
+#####
+# creates the costs of all instances with given proportionality probability step
+# one row per instance, pabutools instances are not built
+#####
+def create_cost_matrix_sweep(num_votes, num_projects, budget, sorted_counts, num_instances, prop_prob_start, prop_prob_step, rng=None):
+
+    prop_probs = create_prop_probs(num_instances, prop_prob_start, prop_prob_step)
+    prop_prob_list = [round(float(prop_prob),2) for prop_prob in prop_probs]
+    cost_matrix = create_cost_matrix(budget, prop_probs, num_projects, sorted_counts, num_votes, rng)
+
+    return cost_matrix, prop_prob_list
+
+
+#####
+# builds the pabutools instance for one row of a cost matrix
+#####
+def create_instance_from_costs(budget, costs, project_names=None):
+    from pabutools.election import Project, Instance
+
+    new_instance = Instance()
+    new_instance.budget_limit = budget
+
+    for p, cost in enumerate(costs):
+        p_name = "p"+str(p) if project_names is None else project_names[p]
+        cost = int(cost)
+        new_instance.add(Project(p_name, cost))
+        new_instance.project_meta.update({p_name: {'cost': cost}})
+
+    return new_instance
+
+
+#####
+# builds the pabutools instances of a cost matrix one at a time
+#####
+def iter_cost_instances(budget, cost_matrix):
+
+    for costs in cost_matrix:
+        yield create_instance_from_costs(budget, costs)
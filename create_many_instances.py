@@ -1,37 +1,69 @@
 import prefsampling.approval as ps
-from pabutools.election import parse_pabulib
-from pabutools.election import write_pabulib
-from pabutools.election import Project, ApprovalBallot, ApprovalProfile, Cost_Sat, Instance
-from collections import defaultdict
+from cost_matrix import create_prop_probs, create_cost_matrix, create_cost_matrix_sweep, create_instance_from_costs, iter_cost_instances
+from ballot_data import ballots_to_csr, ballot_data_from_csr
+from election_store import save_election, create_profile_from_csr
 import random
 import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+
+######
+# samples approval ballots as a list of sets
+# disjoint resampling values according to source paper, 4 central votes like stats_with_instance_plotting
+######
+def sample_ballots(num_votes, num_projects, seed=None):
+    return ps.disjoint_resampling(num_votes,num_projects,0.75,0.125,num_central_votes=4,seed=seed)
 
 
 ######
 # creates ballots
-# disjoint resampling values according to source paper
 # also creates sorted counts, so that the proportionality can be calculated
 ######
-def create_ballots(num_votes, num_projects):
+def create_ballots(num_votes, num_projects, seed=None):
+
+    created_ballots = sample_ballots(num_votes, num_projects, seed)
 
-    created_ballots = ps.disjoint_resampling(num_votes,num_projects,0.75,0.125)
+    counts = np.bincount([number for number_set in created_ballots for number in number_set], minlength=num_projects)
+    sorted_counts = {int(p): int(counts[p]) for p in np.flatnonzero(counts)}
 
-    number_counts = defaultdict(int)
+    return created_ballots, sorted_counts
 
-    for number_set in created_ballots:
-        for number in number_set:
-            number_counts[number] += 1
 
-    sorted_counts = dict(sorted(number_counts.items()))
+######
+# creates the ballots directly as ballot data (CSR arrays and counts), for large electorates
+# the sets of prefsampling are dropped block by block while they are converted
+# chunk_size generates the voters in chunks of that size, so only one chunk of sets exists at a time
+# every chunk resamples with a seed of its own, so the ballots differ from an unchunked run,
+# but they are a sample of the same model: without impartial_central_votes prefsampling
+# always takes the same central votes, whatever the seed
+######
+def create_ballot_arrays(num_votes, num_projects, seed=None, chunk_size=None):
 
-    return created_ballots, sorted_counts
+    if chunk_size is None or chunk_size >= num_votes:
+        sizes, seeds = [num_votes], [seed]
+    else:
+        sizes = [min(chunk_size, num_votes - start) for start in range(0, num_votes, chunk_size)]
+        seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(len(sizes))]
+
+    indptrs = [np.zeros(1, dtype=np.int64)]
+    indices = []
+    for size, chunk_seed in zip(sizes, seeds):
+        ballots = sample_ballots(size, num_projects, chunk_seed)
+        chunk_indptr, chunk_indices = ballots_to_csr(ballots, free=True)
+        del ballots
+        indptrs.append(chunk_indptr[1:] + indptrs[-1][-1])
+        indices.append(chunk_indices)
+
+    return ballot_data_from_csr(np.concatenate(indptrs), np.concatenate(indices), num_projects)
 
 
 ##### 
 # creates one instance with given proportionality probability
 #####
 def create_cost_instance(budget, prop_prob, num_projects, sorted_counts, num_votes):
+    from pabutools.election import Project, Instance
 
     new_instance = Instance()
     new_instance.budget_limit = budget
@@ -65,14 +97,8 @@ def create_cost_instance(budget, prop_prob, num_projects, sorted_counts, num_vot
 ######
 def create_list_cost_instances(num_votes, num_projects, budget, sorted_counts, num_instances, prop_prob_start, prop_prob_step):
 
-    prop_prob = prop_prob_start
-    cost_instances = []
-    prop_prob_list = []
-
-    for i in range(num_instances):
-        prop_prob = prop_prob - prop_prob_step
-        prop_prob_list.append(round(prop_prob,2))
-        cost_instances.append(create_cost_instance(budget, prop_prob, num_projects, sorted_counts, num_votes))
+    cost_matrix, prop_prob_list = create_cost_matrix_sweep(num_votes, num_projects, budget, sorted_counts, num_instances, prop_prob_start, prop_prob_step)
+    cost_instances = list(iter_cost_instances(budget, cost_matrix))
 
     return cost_instances, prop_prob_list
 
@@ -80,6 +106,7 @@ def create_list_cost_instances(num_votes, num_projects, budget, sorted_counts, n
 # creates a profile for a given instance
 #####
 def create_profile(created_ballots, instance):
+    from pabutools.election import ApprovalBallot, ApprovalProfile
 
     profile = ApprovalProfile()
 
@@ -94,25 +121,106 @@ def create_profile(created_ballots, instance):
     return profile
 
 
-def make_instances(num_elections, num_votes, num_projects, budget, num_profiles, prop_prob_start=1, prop_prob_step=0.025):
-    for e in range(num_elections):
+#####
+# seeds of all elections, derived from one master seed
+# election e always gets the same child seed, whatever the number of elections or workers
+# returns the master seed (drawn if None) and one SeedSequence per election
+#####
+def election_seeds(seed, num_elections):
+    master = np.random.SeedSequence(seed)
+
+    return master.entropy, master.spawn(num_elections)
+
+
+#####
+# seed of election e of a master seed, the same as election_seeds(seed, n)[1][e] for any n > e
+#####
+def election_seed(master_seed, e):
+    return np.random.SeedSequence(master_seed, spawn_key=(e,))
+
+
+#####
+# creates the ballots and the costs of one election with num_profiles cost variants
+# all randomness comes from election_seed
+# returns the ballot data, the cost matrix and the probability of proportionality list
+#####
+def generate_election(election_seed, num_votes, num_projects, budget, num_profiles, prop_prob_start, prop_prob_step, ballot_chunk_size=None):
+    ballot_seed, cost_seed = election_seed.spawn(2)
+    rng = np.random.default_rng(cost_seed)
+
+    # 1: create Approval Ballots and Counts for Proportionality
+    ballot_data = create_ballot_arrays(num_votes, num_projects, int(ballot_seed.generate_state(1)[0]), ballot_chunk_size)
+
+    # 2: create the costs of all the differently proportional instances and the probability of proportionality list
+    prop_probs = create_prop_probs(num_profiles, prop_prob_start, prop_prob_step)
+    cost_matrix = create_cost_matrix(budget, prop_probs, num_projects, ballot_data.counts, num_votes, rng)
+    # the actual probabilities, only without the floating point noise of the repeated subtraction
+    prop_prob_list = [round(float(prop_prob), 10) for prop_prob in prop_probs]
+
+    return ballot_data, cost_matrix, prop_prob_list
+
+
+#####
+# creates and saves one election with num_profiles cost variants
+#####
+def make_election(e, election_seed, master_seed, num_votes, num_projects, budget, num_profiles, prop_prob_start, prop_prob_step, output_format, folder, ballot_chunk_size=None):
+    from pabutools.election import write_pabulib
+    ballot_data, cost_matrix, prop_prob_list = generate_election(
+        election_seed, num_votes, num_projects, budget, num_profiles, prop_prob_start, prop_prob_step, ballot_chunk_size,
+    )
+
+    if output_format == "store":
+        # 3/4: save the ballots once and the costs of all instances
+        save_election(folder, e, ballot_data, cost_matrix, budget, {'seed': master_seed, 'election': e, 'prop_prob_list': prop_prob_list})
+        return
+
+    # 3: create the profile
+    profile = create_profile_from_csr(ballot_data, create_instance_from_costs(budget, cost_matrix[0]))
+
+    # 4: save instance files, each instance is only built for writing
+    for var, cost_instance in enumerate(iter_cost_instances(budget, cost_matrix)):
+        cost_instance.meta['description'] = f"seed={master_seed} election={e} var={var} prop_prob={prop_prob_list[var]}"
+
+        instance_file = os.path.join(folder,f"instance_{str(e)}_{str(var)}.pb")
+        write_pabulib(cost_instance, profile, instance_file)
+
+
+#####
+# creates num_elections elections with num_profiles cost variants each
+# output_format="pabulib" writes one instance_<e>_<var>.pb per variant,
+# output_format="store" writes one election_<e> folder per election (see election_store)
+# seed is the master seed, the output only depends on it and not on num_workers
+# num_workers > 1 shares the elections between that many processes
+# folder defaults to instances/ (or instances_store/) next to this file
+# ballot_chunk_size generates large electorates in chunks of voters to bound the memory (see create_ballot_arrays)
+#####
+def make_instances(num_elections, num_votes, num_projects, budget, num_profiles, prop_prob_start=1, prop_prob_step=0.025, output_format="pabulib", seed=None, num_workers=1, folder=None, ballot_chunk_size=None):
+    if output_format not in ("pabulib", "store"):
+        raise ValueError(f"unknown output format {output_format}")
 
-        # 1: create Approval Ballots and Counts for Proportionality
-        created_ballots, sorted_counts = create_ballots(num_votes, num_projects)
+    if folder is None:
+        folder_name = "instances_store" if output_format == "store" else "instances"
+        folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), folder_name)
+    os.makedirs(folder, exist_ok=True)
 
-        # 2: create all the instances with the differently proportional costs and the probability of proportionality list
-        cost_instances, prop_prob_list = create_list_cost_instances(num_votes, num_projects, budget, sorted_counts, num_profiles, prop_prob_start, prop_prob_step)
+    master_seed, seeds = election_seeds(seed, num_elections)
+    make = partial(
+        make_election, master_seed=master_seed, num_votes=num_votes, num_projects=num_projects, budget=budget,
+        num_profiles=num_profiles, prop_prob_start=prop_prob_start, prop_prob_step=prop_prob_step,
+        output_format=output_format, folder=folder, ballot_chunk_size=ballot_chunk_size,
+    )
 
-        # 3: create the profile
-        profile = create_profile(created_ballots, cost_instances[0])
+    if num_workers == 1:
+        for e in range(num_elections):
+            make(e, seeds[e])
+        return master_seed
 
-        folder = os.path.join(os.path.dirname(os.path.abspath(__file__)),"instances")
+    chunksize = max(1, num_elections // (num_workers * 4))
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        list(pool.map(make, range(num_elections), seeds, chunksize=chunksize))
 
-        # 4: save instance files
-        for var in range(len(cost_instances)):
-            
-            instance_file = os.path.join(folder,f"instance_{str(e)}_{str(var)}.pb")
-            write_pabulib(cost_instances[var], profile, instance_file)
+    return master_seed
 
 
-make_instances(num_elections=100, num_votes=1000,num_projects=20,budget=500000,num_profiles=40,prop_prob_start=1,prop_prob_step=0.025)
+if __name__ == "__main__":
+    make_instances(num_elections=100, num_votes=1000,num_projects=20,budget=500000,num_profiles=40,prop_prob_start=1,prop_prob_step=0.025)
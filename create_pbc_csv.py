@@ -1,107 +1,365 @@
 import os
+import io
 import csv
-from pabutools.election import parse_pabulib
-from pabutools.rules import greedy_utilitarian_welfare, method_of_equal_shares
-import scipy.stats as stats
-from collections import defaultdict
-from pabutools.election import Project, ApprovalBallot, ApprovalProfile, Cost_Sat, Instance
-
-def fill_outcome_array(instance, outcome):
-    in_outcome = []
-    for project in instance.project_meta:
-        if project in outcome:
-            in_outcome.append(1)
-        else:
-            in_outcome.append(0)
-    return in_outcome
+import hashlib
+from outcome_cache import cached_mes_outcomes, cached_greedy_outcomes
+from pb_stream import read_pabulib, load_ballot_data
+from election_store import list_elections, load_election
+from pbc_engine import point_biserial
+from instrumentation import recording, stage, add_instances, worker_config, start_worker_recording
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 
-def calc_budget_perc(instance):
-    budget = instance.budget_limit
-    budget_perc = []
-    for project in instance.project_meta:
-        cost = int(instance.project_meta[project]['cost'])
-        budget_perc.append(cost / budget)
-    return budget_perc
+#####
+# reads the budget and the project costs of a pabulib file
+# stops before the votes, they are the same for all instances of an election
+#####
+def load_costs(instance_file):
+    arrays = read_pabulib(instance_file, header_only=True)
 
+    return arrays.project_names, arrays.costs, arrays.budget
 
-def calc_votes_perc(sorted_counts, num_votes):
-    return [votes / num_votes for votes in sorted_counts.values()]
 
+#####
+# calculates the outcomes for the costs of all instances of an election (through the outcome cache)
+# calculates the pbc values from that, one row per instance
+# in the column order of calc_pbc
+#####
+def calc_pbc_matrix(ballot_data, cost_matrix, budget):
+    cost_matrix = np.atleast_2d(cost_matrix)
+
+    with stage('rules'):
+        in_outcome_MES = cached_mes_outcomes(ballot_data, cost_matrix, budget)
+        in_outcome_greedy = cached_greedy_outcomes(ballot_data, cost_matrix, budget)
 
-def calc_differences(budget_perc, votes_perc):
-    return [budget - votes for budget, votes in zip(budget_perc, votes_perc)]
+    with stage('pbc'):
+        return pbc_from_outcomes(ballot_data, cost_matrix, budget, in_outcome_MES, in_outcome_greedy)
 
 
 #####
-# calculates the outcomes for a given instance
-# calculates the pbc values from that
+# pbc values of all instances of an election from outcomes that are already calculated
 #####
-def calc_pbc(profile, instance, sorted_counts, num_votes):
-    in_outcome_MES = []
-    in_outcome_greedy = []
-    budget_perc = []
-    votes_perc = []
-    
-    outcome_MES = method_of_equal_shares(instance, profile.as_multiprofile(), sat_class=Cost_Sat, voter_budget_increment=1)
-    outcome_greedy = greedy_utilitarian_welfare(instance, profile.as_multiprofile(), sat_class=Cost_Sat)
-    
-    in_outcome_MES = fill_outcome_array(instance, outcome_MES)
-    in_outcome_greedy = fill_outcome_array(instance, outcome_greedy)
-    budget_perc = calc_budget_perc(instance)
-    votes_perc = calc_votes_perc(sorted_counts, num_votes)
-    diff = calc_differences(budget_perc, votes_perc)
-
-    in_outcome_MES = list(map(float, in_outcome_MES))
-    in_outcome_greedy = list(map(float, in_outcome_greedy))
-    budget_perc = list(map(float, budget_perc))
-    diff = list(map(float, diff))
-    
-    stat_val_MES_diff, p_val_MES_diff = stats.pointbiserialr(in_outcome_MES, diff)
-    stat_val_greedy_diff, p_val_greedy_diff = stats.pointbiserialr(in_outcome_greedy, diff)
-    
-    stat_val_MES_budget, p_val_MES_budget = stats.pointbiserialr(in_outcome_MES, budget_perc)
-    stat_val_greedy_budget, p_val_greedy_budget = stats.pointbiserialr(in_outcome_greedy, budget_perc)
-    
-    return (
-        stat_val_greedy_budget, p_val_greedy_budget, 
-        stat_val_MES_budget, p_val_MES_budget, 
-        stat_val_greedy_diff, p_val_greedy_diff, 
-        stat_val_MES_diff, p_val_MES_diff
+def pbc_from_outcomes(ballot_data, cost_matrix, budget, in_outcome_MES, in_outcome_greedy):
+    budget_perc = np.atleast_2d(cost_matrix) / budget
+    votes_perc = ballot_data.counts / ballot_data.num_votes
+    diff = budget_perc - votes_perc
+
+    return np.column_stack(
+        point_biserial(in_outcome_greedy, budget_perc) +
+        point_biserial(in_outcome_MES, budget_perc) +
+        point_biserial(in_outcome_greedy, diff) +
+        point_biserial(in_outcome_MES, diff)
     )
 
 
+#####
+# calculates the outcomes for the costs of one instance
+# calculates the pbc values from that
+#####
+def calc_pbc(ballot_data, costs, budget):
+    return tuple(calc_pbc_matrix(ballot_data, costs, budget)[0])
+
+
+CSV_HEADER = [
+    'var', 'prop_prob',
+    'stat_val_greedy_budget', 'p_val_greedy_budget', 
+    'stat_val_MES_budget', 'p_val_MES_budget', 
+    'stat_val_greedy_diff', 'p_val_greedy_diff', 
+    'stat_val_MES_diff', 'p_val_MES_diff'
+]
+
+
+#####
+# probability of proportionality of an instance from the description make_instances writes
+# (... prop_prob=<value>), nan if the file does not have it
+#####
+def prop_prob_of(meta):
+    for field in meta.get('description', '').split():
+        if field.startswith('prop_prob='):
+            return float(field.split('=', 1)[1])
+
+    return float('nan')
+
+
+#####
+# groups sorted instance_<e>_<var>.pb file names by election
+#####
+def group_election_files(files):
+    groups = []
+
+    for file in files:
+        election = file.rsplit('_', 1)[0]
+        if groups and groups[-1][0] == election:
+            groups[-1][1].append(file)
+        else:
+            groups.append((election, [file]))
+
+    return [group for election, group in groups]
+
+
+#####
+# calculates the csv rows of all variants of one election
+# the ballots are parsed from the first file, for the others only the costs are read
+#####
+def evaluate_election_files(folder_path, files):
+    ballot_data = None
+    cost_matrix = []
+    prop_probs = []
+
+    with stage('read'):
+        for file in files:
+            instance_file = os.path.join(folder_path, file)
+
+            if ballot_data is None:
+                ballot_data, arrays = load_ballot_data(instance_file)
+            else:
+                arrays = read_pabulib(instance_file, header_only=True)
+
+            cost_matrix.append(arrays.costs)
+            prop_probs.append(prop_prob_of(arrays.meta))
+            budget = arrays.budget
+
+    pbc = calc_pbc_matrix(ballot_data, np.array(cost_matrix), budget)
+
+    return [[file.split('_')[-1].split('.')[0], prop_prob] + list(values) for file, prop_prob, values in zip(files, prop_probs, pbc)]
+
+
+#####
+# calculates the csv rows of all variants of one stored election
+#####
+def evaluate_stored_election(path):
+    with stage('read'):
+        ballot_data, cost_matrix, meta = load_election(path)
+    pbc = calc_pbc_matrix(ballot_data, cost_matrix, meta['budget'])
+    prop_probs = meta.get('prop_prob_list', [float('nan')] * len(pbc))
+
+    return [[var, prop_probs[var]] + list(values) for var, values in enumerate(pbc)]
+
+
+#####
+# yields func(item) for all items, in the order of items
+# with num_workers > 1 the items are evaluated in a process pool,
+# at most max_in_flight of them at the same time (default 2 * num_workers) to bound memory
+# the workers record into the instrumentation file of the parent if it records (see instrumentation)
+#####
+def ordered_map(func, items, num_workers=1, max_in_flight=None):
+    if num_workers == 1:
+        for item in items:
+            yield func(item)
+        return
+
+    if max_in_flight is None:
+        max_in_flight = 2 * num_workers
+
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=start_worker_recording, initargs=(worker_config(),)) as pool:
+        pending = deque()
+        for item in items:
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+            pending.append(pool.submit(func, item))
+        while pending:
+            yield pending.popleft().result()
+
+
+#####
+# sha256 of a file, or of all files of a stored election folder
+#####
+def content_hash(path):
+    h = hashlib.sha256()
+    files = [os.path.join(path, f) for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+
+    for file in files:
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+
+    return h.hexdigest()
+
+
+#####
+# csv rows as bytes, same format as csv.writer on a file opened with newline=''
+#####
+def format_rows(rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+
+    return buf.getvalue().encode('utf-8')
+
+
+#####
+# appends data and only returns once it is on disk
+#####
+def append_durably(f, data):
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+
+
+#####
+# reads the checkpoint of a results csv
+# one line per evaluated input: start;end;hash;path, start/end are the byte range of its rows
+# a line without newline was cut off by a crash and is ignored
+# returns the entries and the size of the complete lines
+#####
+def read_checkpoint(checkpoint_file):
+    entries = []
+    size = 0
+    if not os.path.exists(checkpoint_file):
+        return entries, size
+
+    with open(checkpoint_file, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            start, end, digest, path = line.decode('utf-8').rstrip('\n').split(';', 3)
+            entries.append((int(start), int(end), digest, path))
+            size += len(line)
+
+    return entries, size
+
+
+#####
+# brings a results csv and its checkpoint back to a consistent state
+# keys: hash of every input of this run by path
+# rows of inputs that are gone or changed are dropped, as are rows written after the last checkpoint line
+# returns the paths that are already done
+#####
+def restore_results(output_csv, checkpoint_file, keys):
+    header = format_rows([CSV_HEADER])
+    entries, checkpoint_size = read_checkpoint(checkpoint_file) if os.path.exists(output_csv) else ([], 0)
+    size = os.path.getsize(output_csv) if entries else 0
+
+    valid = [entry for entry in entries if keys.get(entry[3]) == entry[2] and entry[1] <= size]
+    ends = [len(header)] + [end for start, end, digest, path in entries]
+    contiguous = all(start == ends[i] for i, (start, end, digest, path) in enumerate(entries))
+
+    if entries and len(valid) == len(entries) and contiguous:
+        with open(output_csv, 'r+b') as f:
+            f.truncate(entries[-1][1])
+        with open(checkpoint_file, 'r+b') as f:
+            f.truncate(checkpoint_size)
+        return {path for start, end, digest, path in entries}
+
+    # rebuild both files from the valid rows, without a checkpoint in between a crash only loses progress
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    lines = []
+    with open(output_csv + ".tmp", 'wb') as out:
+        out.write(header)
+        if valid:
+            with open(output_csv, 'rb') as old:
+                for start, end, digest, path in valid:
+                    old.seek(start)
+                    new_start = out.tell()
+                    out.write(old.read(end - start))
+                    lines.append(f"{new_start};{out.tell()};{digest};{path}\n")
+        out.flush()
+        os.fsync(out.fileno())
+
+    with open(checkpoint_file + ".tmp", 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(output_csv + ".tmp", output_csv)
+    os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
+    return {path for start, end, digest, path in valid}
+
+
+#####
+# writes the results of groups of inputs to a csv
+# groups: lists of input paths, evaluate(paths) returns one list of rows per path
+# with checkpoint=True (or resume=True) a checkpoint (<output_csv>.done) is kept next to the csv:
+# every path's rows are appended and synced before its checkpoint line, so partial rows never count as done
+# with resume=True the paths that are done with unchanged content are skipped,
+# otherwise the csv is started from scratch
+# without both the csv is written plainly, no hashes, checkpoint or syncs
+#####
+def write_checkpointed(output_csv, groups, evaluate, num_workers=1, max_in_flight=None, resume=False, checkpoint=False):
+    checkpoint_file = output_csv + ".done"
+    if not (resume or checkpoint):
+        # a checkpoint of an earlier run would not match the new csv
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        with open(output_csv, 'w', newline='') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerow(CSV_HEADER)
+            for paths, rows_per_path in zip(groups, ordered_map(evaluate, groups, num_workers, max_in_flight)):
+                for path, rows in zip(paths, rows_per_path):
+                    csvwriter.writerows(rows)
+                    add_instances(len(rows))
+                    print(path)
+        return
+
+    keys = {path: content_hash(path) for group in groups for path in group} if resume else {}
+
+    done = restore_results(output_csv, checkpoint_file, keys)
+    todo = [missing for missing in ([path for path in group if path not in done] for group in groups) if missing]
+
+    with open(output_csv, 'ab') as csvfile, open(checkpoint_file, 'a', encoding='utf-8') as checkpoint:
+        for paths, rows_per_path in zip(todo, ordered_map(evaluate, todo, num_workers, max_in_flight)):
+            for path, rows in zip(paths, rows_per_path):
+                digest = keys[path] if path in keys else content_hash(path)
+                start = csvfile.tell()
+                append_durably(csvfile, format_rows(rows))
+                append_durably(checkpoint, f"{start};{csvfile.tell()};{digest};{path}\n")
+                add_instances(len(rows))
+
+                print(path)
+
+
+#####
+# csv rows of instance files of one election, one list per file
+#####
+def evaluate_instance_paths(paths):
+    folder_path = os.path.dirname(paths[0])
+
+    with stage('election', paths=paths):
+        return [[row] for row in evaluate_election_files(folder_path, [os.path.basename(path) for path in paths])]
+
+
+#####
+# csv rows of stored elections, one list per election
+#####
+def evaluate_store_paths(paths):
+    rows = []
+    for path in paths:
+        with stage('election', paths=[path]):
+            rows.append(evaluate_stored_election(path))
+
+    return rows
+
+
 #####
 # for all instances in a given folder
 # calculate outcomes and pbc values
 # save in csv
+# the ballots are parsed once per election (instance_<e>_<var>.pb),
+# for the other variants only the costs are read
+# num_workers > 1 evaluates the elections in parallel, rows are still written in file order
+# checkpoint=True keeps a checkpoint so an interrupted run can be continued,
+# resume=True continues it, instances in the checkpoint with unchanged content are skipped
+# instrument/profile_file: files for the json line events and the cProfile dump of the run (see instrumentation), off if None
 #####
-def process_election_instances(folder_path, output_csv):
+def process_election_instances(folder_path, output_csv, num_workers=1, max_in_flight=None, resume=False, instrument=None, profile_file=None, checkpoint=False):
     files = sorted([f for f in os.listdir(folder_path) if f.endswith('.pb')])
+    groups = [[os.path.join(folder_path, file) for file in group] for group in group_election_files(files)]
 
-    with open(output_csv, 'w', newline='') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow([
-            'var', 
-            'stat_val_greedy_budget', 'p_val_greedy_budget', 
-            'stat_val_MES_budget', 'p_val_MES_budget', 
-            'stat_val_greedy_diff', 'p_val_greedy_diff', 
-            'stat_val_MES_diff', 'p_val_MES_diff'
-        ])
+    with recording(instrument, profile_file):
+        write_checkpointed(output_csv, groups, evaluate_instance_paths, num_workers, max_in_flight, resume, checkpoint)
 
-        for file in files:
-            var = file.split('_')[-1].split('.')[0]
-            instance_file = os.path.join(folder_path, file)
-            instance, profile = parse_pabulib(instance_file)
-            num_votes = profile.num_ballots()
-            sorted_counts = defaultdict(int)
-
-            for number_set in profile:
-                for number in number_set:
-                    sorted_counts[number] += 1
-            
-            results = calc_pbc(profile, instance, sorted_counts, num_votes)
-            
-            csvwriter.writerow([var] + list(results))
-
-            print(file)
\ No newline at end of file
+
+#####
+# same as process_election_instances for a folder written by election_store
+# every election is opened once, its variants only differ in the cost row
+#####
+def process_election_store(store_folder, output_csv, num_workers=1, max_in_flight=None, resume=False, instrument=None, profile_file=None, checkpoint=False):
+    groups = [[path] for path in list_elections(store_folder)]
+
+    with recording(instrument, profile_file):
+        write_checkpointed(output_csv, groups, evaluate_store_paths, num_workers, max_in_flight, resume, checkpoint)
@@ -2,19 +2,61 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+from pbc_aggregation import aggregate_csv, mean_frame, summary_frame
+from pbc_bootstrap import election_matrix, bootstrap_means, percentile_band
+
+#####
+# bootstrap means of all statistic columns by column name, None if num_resamples is 0
+#####
+def bootstrap_columns(csv_file, num_resamples, seed, chunksize):
+    if num_resamples == 0:
+        return None
+
+    vars, columns, data = election_matrix(csv_file, chunksize)
+    means = bootstrap_means(data, num_resamples, seed)
+
+    return {column: means[:, :, c] for c, column in enumerate(columns)}
+
+
+#####
+# draws the percentile band of bootstrap samples (resamples x vars) behind a curve
+#####
+def plot_band(proportionality_prob, samples, sorted_indices, confidence, color):
+    if samples is None:
+        return
+
+    lower, upper = percentile_band(samples, confidence)
+    plt.fill_between(proportionality_prob, lower[sorted_indices], upper[sorted_indices], color=color, alpha=0.2, linewidth=0)
+
 
 #####
 # plots and saves the pbc comparative statistical data from a given csv
+# the csv is aggregated in chunks of chunksize rows, so its size does not matter
+# also saves the mean, standard deviation and count per var as pbc_summary.csv
+# adds bootstrap percentile bands (elections resampled with replacement), num_resamples=0 turns them off
 #####
-def plot_pbc_from_csv(csv_file, output_folder):
-    df = pd.read_csv(csv_file)
+def plot_pbc_from_csv(csv_file, output_folder, chunksize=1_000_000, num_resamples=1000, confidence=0.95, seed=None):
+    aggregates = aggregate_csv(csv_file, chunksize)
+    summary_frame(aggregates).to_csv(os.path.join(output_folder, 'pbc_summary.csv'), index=False)
 
-    grouped_df = df.groupby('var').mean().reset_index()
+    grouped_df = mean_frame(aggregates)
+    boot = bootstrap_columns(csv_file, num_resamples, seed, chunksize)
 
-    proportionality_prob = 1 - (0.025 * (grouped_df['var'] + 1))
+    # csvs written before the prop_prob column only have the var of the default sweep
+    if 'prop_prob' in grouped_df and grouped_df['prop_prob'].notna().any():
+        proportionality_prob = grouped_df['prop_prob']
+    else:
+        proportionality_prob = 1 - (0.025 * (grouped_df['var'] + 1))
 
     sorted_indices = np.argsort(proportionality_prob)
     proportionality_prob = proportionality_prob[sorted_indices]
+
+    # band of a column, or of the difference of two columns, behind its curve
+    def band(column, color, minus=None):
+        if boot is not None:
+            samples = boot[column] if minus is None else boot[column] - boot[minus]
+            plot_band(proportionality_prob, samples, sorted_indices, confidence, color)
+
     stat_val_greedy_budget = grouped_df['stat_val_greedy_budget'].iloc[sorted_indices]
     p_val_greedy_budget = grouped_df['p_val_greedy_budget'].iloc[sorted_indices]
     stat_val_MES_budget = grouped_df['stat_val_MES_budget'].iloc[sorted_indices]
@@ -29,7 +71,9 @@ def plot_pbc_from_csv(csv_file, output_folder):
 
     plt.subplot(4, 1, 1)
     plt.plot(proportionality_prob, stat_val_greedy_budget, label='Greedy', color='blue')
+    band('stat_val_greedy_budget', 'blue')
     plt.plot(proportionality_prob, stat_val_MES_budget, label='MES', color='orange')
+    band('stat_val_MES_budget', 'orange')
     plt.xlabel('Proportionality Probability')
     plt.ylabel('Statistic Value')
     plt.title('Statistics for Budget Percentage')
@@ -38,7 +82,9 @@ def plot_pbc_from_csv(csv_file, output_folder):
 
     plt.subplot(4, 1, 2)
     plt.plot(proportionality_prob, p_val_greedy_budget, label='Greedy', color='blue')
+    band('p_val_greedy_budget', 'blue')
     plt.plot(proportionality_prob, p_val_MES_budget, label='MES', color='orange')
+    band('p_val_MES_budget', 'orange')
     plt.xlabel('Proportionality Probability')
     plt.ylabel('P-value')
     plt.title('P-values for Budget Percentage')
@@ -47,6 +93,7 @@ def plot_pbc_from_csv(csv_file, output_folder):
 
     plt.subplot(4, 1, 3)
     plt.plot(proportionality_prob, stat_val_greedy_budget - stat_val_MES_budget, label='Difference (Greedy - MES)', color='green')
+    band('stat_val_greedy_budget', 'green', minus='stat_val_MES_budget')
     plt.xlabel('Proportionality Probability')
     plt.ylabel('Difference in Statistic Value')
     plt.title('Difference in Statistics (Greedy - MES) for Budget Percentage')
@@ -55,6 +102,7 @@ def plot_pbc_from_csv(csv_file, output_folder):
 
     plt.subplot(4, 1, 4)
     plt.plot(proportionality_prob, p_val_greedy_budget - p_val_MES_budget, label='Difference (Greedy - MES)', color='purple')
+    band('p_val_greedy_budget', 'purple', minus='p_val_MES_budget')
     plt.xlabel('Proportionality Probability')
     plt.ylabel('Difference in P-value')
     plt.title('Difference in P-values (Greedy - MES) for Budget Percentage')
@@ -69,7 +117,9 @@ def plot_pbc_from_csv(csv_file, output_folder):
 
     plt.subplot(4, 1, 1)
     plt.plot(proportionality_prob, stat_val_greedy_diff, label='Greedy', color='blue')
+    band('stat_val_greedy_diff', 'blue')
     plt.plot(proportionality_prob, stat_val_MES_diff, label='MES', color='orange')
+    band('stat_val_MES_diff', 'orange')
     plt.xlabel('Proportionality Probability')
     plt.ylabel('Statistic Value')
     plt.title('Statistics for Difference')
@@ -78,7 +128,9 @@ def plot_pbc_from_csv(csv_file, output_folder):
 
     plt.subplot(4, 1, 2)
     plt.plot(proportionality_prob, p_val_greedy_diff, label='Greedy', color='blue')
+    band('p_val_greedy_diff', 'blue')
     plt.plot(proportionality_prob, p_val_MES_diff, label='MES', color='orange')
+    band('p_val_MES_diff', 'orange')
     plt.xlabel('Proportionality Probability')
     plt.ylabel('P-value')
     plt.title('P-values for Difference')
@@ -87,6 +139,7 @@ def plot_pbc_from_csv(csv_file, output_folder):
 
     plt.subplot(4, 1, 3)
     plt.plot(proportionality_prob, stat_val_greedy_diff - stat_val_MES_diff, label='Difference (Greedy - MES)', color='green')
+    band('stat_val_greedy_diff', 'green', minus='stat_val_MES_diff')
     plt.xlabel('Proportionality Probability')
     plt.ylabel('Difference in Statistic Value')
     plt.title('Difference in Statistics (Greedy - MES) for Difference')
@@ -95,6 +148,7 @@ def plot_pbc_from_csv(csv_file, output_folder):
 
     plt.subplot(4, 1, 4)
     plt.plot(proportionality_prob, p_val_greedy_diff - p_val_MES_diff, label='Difference (Greedy - MES)', color='purple')
+    band('p_val_greedy_diff', 'purple', minus='p_val_MES_diff')
     plt.xlabel('Proportionality Probability')
     plt.ylabel('Difference in P-value')
     plt.title('Difference in P-values (Greedy - MES) for Difference')
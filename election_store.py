@@ -0,0 +1,134 @@
+from ballot_data import BallotData
+from pb_stream import read_pabulib, load_ballot_data
+from cost_matrix import create_instance_from_costs
+import numpy as np
+import json
+import os
+import shutil
+
+STORE_VERSION = 1
+ARRAYS = ['indptr', 'indices', 'types', 'multiplicities', 'counts', 'costs']
+
+
+#####
+# folder of one election inside a store
+#####
+def election_path(store_folder, e):
+    return os.path.join(store_folder, f"election_{str(e)}")
+
+
+#####
+# saves one election: the ballots once, the costs of all variants as one matrix
+# meta holds e.g. the seed and the prop_prob list of the sweep
+# written to a temporary folder first, so readers never see half an election
+#####
+def save_election(store_folder, e, ballot_data, cost_matrix, budget, meta=None):
+
+    path = election_path(store_folder, e)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    arrays = ballot_data._asdict()
+    arrays['costs'] = np.asarray(cost_matrix)
+    for name in ARRAYS:
+        np.save(os.path.join(tmp_path, name + ".npy"), np.ascontiguousarray(arrays[name]))
+
+    election_meta = dict(meta or {})
+    election_meta.update({
+        'version': STORE_VERSION,
+        'budget': int(budget) if float(budget).is_integer() else float(budget),
+        'num_votes': int(ballot_data.num_votes),
+        'project_names': list(ballot_data.project_names),
+        'num_variants': int(arrays['costs'].shape[0]),
+    })
+    with open(os.path.join(tmp_path, "meta.json"), 'w') as f:
+        json.dump(election_meta, f)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+    return path
+
+
+#####
+# opens one election, arrays are memory mapped (read-only) unless mmap=False
+# returns the ballot data, the cost matrix and the meta data
+#####
+def load_election(path, mmap=True):
+
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode) for name in ARRAYS}
+
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    ballot_data = BallotData(
+        meta['num_votes'], tuple(meta['project_names']),
+        arrays['indptr'], arrays['indices'], arrays['types'], arrays['multiplicities'], arrays['counts'],
+    )
+
+    return ballot_data, arrays['costs'], meta
+
+
+#####
+# all elections of a store, sorted by election index
+#####
+def list_elections(store_folder):
+
+    elections = [d for d in os.listdir(store_folder) if d.startswith("election_") and not d.endswith(".tmp")]
+    elections.sort(key=lambda d: int(d.split('_')[-1]))
+
+    return [os.path.join(store_folder, d) for d in elections]
+
+
+#####
+# builds the pabutools profile of an election from its CSR approvals
+#####
+def create_profile_from_csr(ballot_data, instance):
+    from pabutools.election import ApprovalBallot, ApprovalProfile
+
+    projects = [instance.get_project(name) for name in ballot_data.project_names]
+    profile = ApprovalProfile()
+
+    for v in range(ballot_data.num_votes):
+        ballot = ApprovalBallot()
+        for p in ballot_data.indices[ballot_data.indptr[v]:ballot_data.indptr[v + 1]]:
+            ballot.add(projects[p])
+        profile.append(ballot)
+
+    return profile
+
+
+#####
+# writes all variants of a stored election as instance_<e>_<var>.pb files
+#####
+def election_to_pabulib(path, output_folder, e):
+    from pabutools.election import write_pabulib
+
+    ballot_data, cost_matrix, meta = load_election(path)
+    os.makedirs(output_folder, exist_ok=True)
+    profile = None
+
+    for var, costs in enumerate(cost_matrix):
+        instance = create_instance_from_costs(meta['budget'], costs, ballot_data.project_names)
+        if profile is None:
+            profile = create_profile_from_csr(ballot_data, instance)
+        write_pabulib(instance, profile, os.path.join(output_folder, f"instance_{str(e)}_{str(var)}.pb"))
+
+
+#####
+# stores the variants of one election given as pabulib files (in variant order)
+# the ballots are only parsed from the first file
+#####
+def pabulib_to_election(files, store_folder, e, meta=None):
+
+    ballot_data, arrays = load_ballot_data(files[0])
+
+    cost_matrix = [arrays.costs]
+    for file in files[1:]:
+        cost_matrix.append(read_pabulib(file, header_only=True).costs)
+
+    return save_election(store_folder, e, ballot_data, np.array(cost_matrix), arrays.budget, meta)
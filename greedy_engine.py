@@ -0,0 +1,60 @@
+from mes_engine import lexico_ranks, default_project_names, instance_to_arrays
+import jit_kernels
+import numpy as np
+
+
+#####
+# greedy_utilitarian_welfare with Cost_Sat for all cost variants of an election
+# under Cost_Sat the satisfaction per cost of a project is its approval count
+# (0 for projects that cost nothing), ties are broken by project name
+# counts: approvals per project, cost_matrix: variants x projects
+# returns a variants x projects boolean matrix of the selected projects
+#####
+def greedy_cost_sat(counts, cost_matrix, budget_limit, project_names=None):
+
+    cost_matrix = np.atleast_2d(cost_matrix)
+    counts = np.asarray(counts)
+    num_variants, num_projects = cost_matrix.shape
+
+    if project_names is None:
+        project_names = default_project_names(num_projects)
+    name_ranks = np.broadcast_to(lexico_ranks(project_names), cost_matrix.shape)
+
+    density = np.where(cost_matrix > 0, counts, 0)
+    order = np.lexsort((name_ranks, -density), axis=1)
+
+    rows = np.arange(num_variants)
+    remaining = np.full(num_variants, budget_limit, dtype=cost_matrix.dtype)
+    if jit_kernels.enabled:
+        return jit_kernels.greedy_select(order, cost_matrix, remaining)
+
+    selected = np.zeros(cost_matrix.shape, dtype=bool)
+
+    for position in range(num_projects):
+        projects = order[:, position]
+        costs = cost_matrix[rows, projects]
+        fits = costs <= remaining
+        selected[rows, projects] = fits
+        remaining = remaining - np.where(fits, costs, 0)
+
+    return selected
+
+
+#####
+# drop-in replacement for pabutools' greedy_utilitarian_welfare with Cost_Sat
+# sat_class=None is Cost_Sat
+#####
+def greedy_utilitarian_welfare_fast(instance, profile, sat_class=None):
+    from pabutools.election import Cost_Sat
+    from pabutools.rules import BudgetAllocation
+
+    if sat_class is not None and sat_class is not Cost_Sat:
+        raise ValueError("greedy_utilitarian_welfare_fast only supports Cost_Sat")
+
+    projects, types, multiplicities, costs = instance_to_arrays(instance, profile)
+    counts = (types * multiplicities[:, None]).sum(axis=0)
+
+    selected = greedy_cost_sat(counts, costs, instance.budget_limit, [p.name for p in projects])[0]
+
+    return BudgetAllocation([projects[p] for p in np.flatnonzero(selected)])
+
@@ -0,0 +1,126 @@
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+RENDER_MODES = ("off", "sampled", "full")
+NUM_BINS = 20
+
+# figure template of this process, built on first use
+template = None
+
+
+#####
+# percentages of the votes and of the budget of every project and their differences
+# same values as stats_with_instance_plotting.histogramm, one row per instance
+#####
+def histogram_data(counts, cost_matrix, num_votes, budget):
+    votes_perc = np.asarray(counts) / num_votes * 100
+    budget_perc = np.atleast_2d(cost_matrix) / budget * 100
+
+    return votes_perc, budget_perc, budget_perc - votes_perc
+
+
+#####
+# builds the two panel figure of histogramm once, on the Agg canvas
+# returns the figure and the artists that change between instances
+#####
+def create_template(num_projects):
+    fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(fig)
+
+    ax_scatter = fig.add_subplot(1, 2, 1)
+    scatter = ax_scatter.scatter(np.zeros(num_projects), np.zeros(num_projects))
+    ax_scatter.plot([0, 100], [0, 100], color='gray', linestyle='--', label='Proportional')
+    ax_scatter.set_xlabel('Percentage of Votes Received')
+    ax_scatter.set_ylabel('Percentage of Budget Used')
+    ax_scatter.set_title('Approval Votes vs. Budget Usage')
+    ax_scatter.legend()
+    ax_scatter.grid(True)
+    # all percentages are within [0, 100], so the limits of the proportional line stay the same
+    ax_scatter.set_xlim(-5, 105)
+    ax_scatter.set_ylim(-5, 105)
+
+    ax_hist = fig.add_subplot(1, 2, 2)
+    counts, edges, bars = ax_hist.hist(np.arange(NUM_BINS), bins=NUM_BINS, color='skyblue', edgecolor='black')
+    ax_hist.set_xlabel('Difference (Budget - Votes)')
+    ax_hist.set_ylabel('Number of Projects')
+    ax_hist.set_title('Difference between Budget and Votes Percentages')
+    ax_hist.grid(True)
+
+    fig.tight_layout()
+
+    return fig, scatter, ax_hist, bars
+
+
+#####
+# draws one instance into the template and saves it
+# only the data of the artists and the limits of the histogram change
+#####
+def render_histogram(fig, scatter, ax_hist, bars, votes_perc, budget_perc, differences, save_name):
+    scatter.set_offsets(np.column_stack((votes_perc, budget_perc)))
+
+    counts, edges = np.histogram(differences, bins=NUM_BINS)
+    for bar, height, left, right in zip(bars, counts, edges[:-1], edges[1:]):
+        bar.set_x(left)
+        bar.set_width(right - left)
+        bar.set_height(height)
+
+    # same limits as the autoscaling of plt.hist
+    margin = 0.05 * (edges[-1] - edges[0])
+    ax_hist.set_xlim(edges[0] - margin, edges[-1] + margin)
+    ax_hist.set_ylim(0, 1.05 * max(counts.max(), 1))
+
+    fig.savefig(save_name)
+
+
+#####
+# renders a list of (votes_perc, budget_perc, differences, save_name) jobs with the template of this process
+#####
+def render_histograms(jobs):
+    global template
+
+    for votes_perc, budget_perc, differences, save_name in jobs:
+        if template is None or len(template[1].get_offsets()) != len(votes_perc):
+            template = create_template(len(votes_perc))
+        render_histogram(*template, votes_perc, budget_perc, differences, save_name)
+
+    return len(jobs)
+
+
+#####
+# indices of the instances that are rendered in a mode
+# "off": none, "sampled": every sample_every-th instance (starting with the first), "full": all
+#####
+def selected_instances(num_instances, mode="full", sample_every=10):
+    if mode not in RENDER_MODES:
+        raise ValueError(f"unknown render mode {mode}")
+
+    if mode == "off":
+        return []
+    if mode == "sampled":
+        return list(range(0, num_instances, sample_every))
+
+    return list(range(num_instances))
+
+
+#####
+# renders the histograms of all selected instances of a cost matrix
+# save_names: one file name per instance
+# num_workers > 1 shares the figures between that many processes, each with a template of its own
+# returns the number of rendered figures
+#####
+def render_all(counts, cost_matrix, num_votes, budget, save_names, mode="full", sample_every=10, num_workers=1):
+    rows = selected_instances(len(save_names), mode, sample_every)
+    if not rows:
+        return 0
+
+    votes_perc, budget_perc, differences = histogram_data(counts, np.asarray(cost_matrix)[rows], num_votes, budget)
+    jobs = [(votes_perc, budget_perc[i], differences[i], save_names[row]) for i, row in enumerate(rows)]
+
+    if num_workers == 1:
+        return render_histograms(jobs)
+
+    chunks = [jobs[w::num_workers] for w in range(num_workers)]
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        return sum(pool.map(render_histograms, chunks))
@@ -0,0 +1,110 @@
+from collections import namedtuple, OrderedDict
+from create_many_instances import election_seed, election_seeds, generate_election
+from create_pbc_csv import CSV_HEADER, calc_pbc_matrix, ordered_map
+from functools import partial
+import csv
+
+#####
+# a sweep of generated elections that is never written to disk
+# an instance is fully described by (seed, election, variant) and the generation parameters,
+# it is regenerated when it is accessed, exactly as make_instances would write it
+#####
+InstanceCatalog = namedtuple('InstanceCatalog', [
+    'seed', 'num_elections', 'num_votes', 'num_projects', 'budget', 'num_profiles', 'prop_prob_start', 'prop_prob_step', 'ballot_chunk_size',
+], defaults=[None])
+
+# recently materialized elections of all catalogs, least recently used first
+CACHE_SIZE = 16
+elections = OrderedDict()
+
+
+#####
+# creates a catalog, seed=None draws a master seed (stored in the catalog)
+#####
+def create_catalog(num_elections, num_votes, num_projects, budget, num_profiles, prop_prob_start=1, prop_prob_step=0.025, seed=None, ballot_chunk_size=None):
+    master_seed, _ = election_seeds(seed, 0)
+
+    return InstanceCatalog(master_seed, num_elections, num_votes, num_projects, budget, num_profiles, prop_prob_start, prop_prob_step, ballot_chunk_size)
+
+
+#####
+# ballot data, cost matrix and meta data of election e, same as election_store.load_election
+# of an election saved by make_instances with the same seed
+# the last CACHE_SIZE elections are kept in memory
+#####
+def get_election(catalog, e):
+    if not 0 <= e < catalog.num_elections:
+        raise IndexError(f"election {e} is not in the catalog")
+
+    key = (catalog, e)
+    if key in elections:
+        elections.move_to_end(key)
+        return elections[key]
+
+    ballot_data, cost_matrix, prop_prob_list = generate_election(
+        election_seed(catalog.seed, e), catalog.num_votes, catalog.num_projects, catalog.budget,
+        catalog.num_profiles, catalog.prop_prob_start, catalog.prop_prob_step, catalog.ballot_chunk_size,
+    )
+    cost_matrix.flags.writeable = False
+    meta = {'seed': catalog.seed, 'election': e, 'prop_prob_list': prop_prob_list, 'budget': catalog.budget}
+
+    elections[key] = (ballot_data, cost_matrix, meta)
+    while len(elections) > CACHE_SIZE:
+        elections.popitem(last=False)
+
+    return elections[key]
+
+
+#####
+# ballot data, costs, budget and probability of proportionality of one instance
+#####
+def get_instance(catalog, e, var):
+    ballot_data, cost_matrix, meta = get_election(catalog, e)
+
+    return ballot_data, cost_matrix[var], catalog.budget, meta['prop_prob_list'][var]
+
+
+#####
+# (election, variant) of all instances of the catalog in order
+#####
+def instance_ids(catalog):
+    for e in range(catalog.num_elections):
+        for var in range(catalog.num_profiles):
+            yield e, var
+
+
+#####
+# yields (e, ballot data, cost matrix, meta) for a range of elections
+#####
+def iter_elections(catalog, start=0, stop=None):
+    stop = catalog.num_elections if stop is None else min(stop, catalog.num_elections)
+
+    for e in range(start, stop):
+        yield (e,) + get_election(catalog, e)
+
+
+#####
+# csv rows of all variants of one election of a catalog
+#####
+def evaluate_catalog_election(catalog, e):
+    ballot_data, cost_matrix, meta = get_election(catalog, e)
+    pbc = calc_pbc_matrix(ballot_data, cost_matrix, catalog.budget)
+
+    return [[var, meta['prop_prob_list'][var]] + list(values) for var, values in enumerate(pbc)]
+
+
+#####
+# same as create_pbc_csv.process_election_store for a catalog, nothing but the csv is written
+# every worker regenerates the elections it evaluates
+#####
+def process_catalog(catalog, output_csv, num_workers=1, max_in_flight=None):
+    indices = range(catalog.num_elections)
+
+    with open(output_csv, 'w', newline='') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(CSV_HEADER)
+
+        for e, rows in zip(indices, ordered_map(partial(evaluate_catalog_election, catalog), indices, num_workers, max_in_flight)):
+            csvwriter.writerows(rows)
+
+            print(e)
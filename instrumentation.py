@@ -0,0 +1,217 @@
+from contextlib import contextmanager, nullcontext
+import numpy as np
+import cProfile
+import resource
+import json
+import time
+import os
+
+# recording of this process, None while the instrumentation is off
+# pool workers get it through start_worker_recording (see worker_config), whatever the start method
+recorder = None
+
+# what stage() returns while the instrumentation is off
+NO_STAGE = nullcontext()
+
+# bins of the latency histograms in seconds, 4 per decade from 10 us to 1000 s
+LATENCY_EDGES = np.logspace(-5, 3, 33)
+
+# number of the slowest solves listed per rule in the summary
+NUM_SLOWEST = 10
+
+
+#####
+# writes one event as a json line, with the labels of the enclosing stages
+# the file is opened in append mode and line buffered, so lines of forked workers do not mix
+#####
+def emit(event, **fields):
+    if recorder is not None and recorder['events'] is not None:
+        recorder['events'].write(json.dumps({'event': event, 'time': time.time(), 'pid': os.getpid(), **recorder['labels'], **fields}) + '\n')
+
+
+#####
+# starts recording: json line events to output_file and/or a cProfile dump to profile_file
+# output_file is overwritten
+#####
+def start_recording(output_file=None, profile_file=None):
+    global recorder
+
+    events = None
+    if output_file:
+        open(output_file, 'w').close()
+        events = open(output_file, 'a', buffering=1, encoding='utf-8')
+
+    profiler = None
+    if profile_file:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    recorder = {'events': events, 'output_file': output_file, 'profiler': profiler, 'profile_file': profile_file, 'labels': {}, 'start': time.perf_counter()}
+    emit('start')
+
+
+#####
+# stops recording, writes the profile and a summary event (see summarize_events)
+# returns the summary, None without output_file
+#####
+def stop_recording():
+    global recorder
+
+    if recorder['profiler'] is not None:
+        recorder['profiler'].disable()
+        recorder['profiler'].dump_stats(recorder['profile_file'])
+
+    # ru_maxrss is in kilobytes on Linux
+    emit('stop', seconds=time.perf_counter() - recorder['start'],
+         peak_rss_bytes=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+         peak_rss_children_bytes=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+
+    summary = None
+    if recorder['events'] is not None:
+        recorder['events'].close()
+        summary = summarize_events(recorder['output_file'])
+        with open(recorder['output_file'], 'a', encoding='utf-8') as events:
+            events.write(json.dumps({'event': 'summary', **summary}) + '\n')
+
+    recorder = None
+
+    return summary
+
+
+#####
+# records everything inside the with block, does nothing if both files are None
+#####
+@contextmanager
+def recording(output_file=None, profile_file=None):
+    if output_file is None and profile_file is None:
+        yield
+        return
+
+    start_recording(output_file, profile_file)
+    try:
+        yield
+    finally:
+        stop_recording()
+
+
+#####
+# what a pool worker needs to record its events into the same file, None while nothing is recorded
+# passed to the pool as ProcessPoolExecutor(initializer=start_worker_recording, initargs=(worker_config(),)),
+# so spawn and forkserver workers record too (fork alone would only inherit the global)
+#####
+def worker_config():
+    if recorder is None or recorder['events'] is None:
+        return None
+
+    return {'output_file': recorder['output_file'], 'labels': dict(recorder['labels'])}
+
+
+#####
+# pool initializer, appends the events of the worker to the file of worker_config
+# the worker does not profile and writes no summary, that is left to the parent
+#####
+def start_worker_recording(config):
+    global recorder
+
+    if config is None:
+        recorder = None
+        return
+
+    events = open(config['output_file'], 'a', buffering=1, encoding='utf-8')
+    recorder = {'events': events, 'output_file': config['output_file'], 'profiler': None, 'profile_file': None, 'labels': config['labels'], 'start': time.perf_counter()}
+
+
+#####
+# times a stage, the fields label the stage and every event inside it
+# returns a shared no-op context while the instrumentation is off
+#####
+def stage(name, **fields):
+    if recorder is None:
+        return NO_STAGE
+
+    return recorded_stage(name, fields)
+
+
+@contextmanager
+def recorded_stage(name, fields):
+    labels = recorder['labels']
+    recorder['labels'] = {**labels, **fields}
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        recorder['labels'] = labels
+        emit('stage', stage=name, seconds=seconds, **fields)
+
+
+#####
+# calls function(*args) and records its latency as a solve of rule covering instances instances
+# only the call itself while the instrumentation is off
+#####
+def measured(rule, instances, function, *args):
+    if recorder is None:
+        return function(*args)
+
+    start = time.perf_counter()
+    result = function(*args)
+    emit('solve', rule=rule, seconds=time.perf_counter() - start, instances=instances)
+
+    return result
+
+
+#####
+# counts finished instances for the throughput
+#####
+def add_instances(instances):
+    if recorder is not None:
+        emit('instances', instances=instances)
+
+
+#####
+# summary of an event file
+# stages: count and total seconds per stage name
+# rules: per instance latency per rule, percentiles, histogram (LATENCY_EDGES) and the slowest solves with their labels
+# throughput: finished instances per second of the recording, peak rss of the process and of its finished workers
+#####
+def summarize_events(output_file):
+    stages = {}
+    latencies = {}
+    solves = {}
+    instances = 0
+    stop = {}
+
+    with open(output_file, encoding='utf-8') as events:
+        for line in events:
+            event = json.loads(line)
+            if event['event'] == 'stage':
+                totals = stages.setdefault(event['stage'], {'count': 0, 'seconds': 0.0})
+                totals['count'] += 1
+                totals['seconds'] += event['seconds']
+            elif event['event'] == 'solve':
+                latencies.setdefault(event['rule'], []).extend([event['seconds'] / event['instances']] * event['instances'])
+                solves.setdefault(event['rule'], []).append(event)
+            elif event['event'] == 'instances':
+                instances += event['instances']
+            elif event['event'] == 'stop':
+                stop = event
+
+    rules = {}
+    for rule, values in latencies.items():
+        values = np.array(values)
+        slowest = sorted(solves[rule], key=lambda event: -event['seconds'] / event['instances'])[:NUM_SLOWEST]
+        rules[rule] = {
+            'instances': len(values), 'seconds': float(values.sum()),
+            'p50': float(np.percentile(values, 50)), 'p90': float(np.percentile(values, 90)),
+            'p99': float(np.percentile(values, 99)), 'max': float(values.max()),
+            'histogram': {'edges': LATENCY_EDGES.tolist(), 'counts': np.histogram(values, LATENCY_EDGES)[0].tolist()},
+            'slowest': slowest,
+        }
+
+    seconds = stop.get('seconds')
+
+    return {
+        'stages': stages, 'rules': rules, 'instances': instances, 'seconds': seconds,
+        'throughput': instances / seconds if seconds else None,
+        'peak_rss_bytes': stop.get('peak_rss_bytes'), 'peak_rss_children_bytes': stop.get('peak_rss_children_bytes'),
+    }
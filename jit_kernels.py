@@ -0,0 +1,217 @@
+from importlib.util import find_spec
+import numpy as np
+import os
+
+# compiled versions of the inner loops of mes_engine, greedy_engine and ballot_data
+# they are used when numba is installed, USE_NUMBA=0 switches them off
+# numba is only imported when the first kernel is compiled, the compiled code is cached on disk
+# (numba's cache next to this file, or in NUMBA_CACHE_DIR)
+enabled = os.environ.get("USE_NUMBA", "1") != "0" and find_spec("numba") is not None
+
+# compiled kernels by name
+compiled = {}
+
+
+#####
+# the compiled version of a kernel, compiled (or loaded from the disk cache) on first use
+# error_model='numpy' gives inf/nan on division by zero like the numpy engines
+#####
+def kernel(function):
+    if function.__name__ not in compiled:
+        import numba
+        compiled[function.__name__] = numba.njit(cache=True, error_model='numpy')(function)
+
+    return compiled[function.__name__]
+
+
+#####
+# approvals of every voter as a packed bitset and the approvals per project, in one pass over the CSR matrix
+# same result as ballot_data.packed_approvals and np.bincount
+#####
+def pack_approvals_kernel(indptr, indices, num_projects):
+    num_votes = len(indptr) - 1
+    packed = np.zeros((num_votes, (num_projects + 7) // 8), dtype=np.uint8)
+    counts = np.zeros(num_projects, dtype=np.int64)
+
+    for v in range(num_votes):
+        for k in range(indptr[v], indptr[v + 1]):
+            p = indices[k]
+            packed[v, p >> 3] |= np.uint8(128 >> (p & 7))
+            counts[p] += 1
+
+    return packed, counts
+
+
+def pack_approvals(indptr, indices, num_projects):
+    return kernel(pack_approvals_kernel)(np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64), num_projects)
+
+
+#####
+# greedy selection of all variants, order: variants x projects in selection order
+# remaining: the budget of every variant in the dtype of the costs
+#####
+def greedy_kernel(order, cost_matrix, remaining):
+    num_variants, num_projects = cost_matrix.shape
+    selected = np.zeros((num_variants, num_projects), dtype=np.bool_)
+
+    for var in range(num_variants):
+        left = remaining[var]
+        for position in range(num_projects):
+            p = order[var, position]
+            if cost_matrix[var, p] <= left:
+                selected[var, p] = True
+                left -= cost_matrix[var, p]
+
+    return selected
+
+
+def greedy_select(order, cost_matrix, remaining):
+    return kernel(greedy_kernel)(np.ascontiguousarray(order, dtype=np.int64), np.ascontiguousarray(cost_matrix), remaining)
+
+
+#####
+# one run of MES with Cost_Sat for a fixed budget per voter, the loop version of mes_engine.mes_rounds
+# the rounds, tolerances and tie-breaking are the same, so the outcomes and breakpoints are too
+# the types are walked in budget order row by row, every remaining project keeps its own running sums
+# returns the selected projects in selection order and the breakpoint (inf without track)
+#####
+def mes_rounds_kernel(types, weights, costs, voter_budget, name_ranks, candidates, track, afford_tol, tie_tol):
+    num_types, num_projects = types.shape
+    budgets = np.full(num_types, voter_budget)
+    slopes = np.ones(num_types) if track else np.zeros(num_types)
+    remaining = np.flatnonzero(candidates)
+    selected = np.empty(num_projects, dtype=np.int64)
+    num_selected = 0
+    breakpoint = np.inf
+
+    while len(remaining) > 0:
+        n = len(remaining)
+        c = costs[remaining]
+        order = np.argsort(budgets, kind='mergesort')
+
+        total_w = np.zeros(n)
+        total_budget = np.zeros(n)
+        total_slope = np.zeros(n)
+        for i in range(num_types):
+            o = order[i]
+            for j in range(n):
+                if types[o, remaining[j]]:
+                    total_w[j] += weights[o]
+                    total_budget[j] += weights[o] * budgets[o]
+                    total_slope[j] += weights[o] * slopes[o]
+
+        # without a supporter that can pay rho, first is 0 like np.argmax of no match
+        rho = c / total_w
+        rho_slope = -0.0 / total_w
+        first = np.zeros(n, dtype=np.int64)
+        found = np.zeros(n, dtype=np.bool_)
+        count_before = np.zeros(n)
+        paid_before = np.zeros(n)
+        slope_before = np.zeros(n)
+        num_found = 0
+        for i in range(num_types):
+            if num_found == n:
+                break
+            o = order[i]
+            for j in range(n):
+                if found[j] or not types[o, remaining[j]]:
+                    continue
+                count_left = total_w[j] - count_before[j]
+                r = (c[j] - paid_before[j]) / count_left
+                if r <= budgets[o] + afford_tol * c[j]:
+                    rho[j] = r
+                    rho_slope[j] = -slope_before[j] / count_left
+                    first[j] = i
+                    found[j] = True
+                    num_found += 1
+                else:
+                    count_before[j] += weights[o]
+                    paid_before[j] += weights[o] * budgets[o]
+                    slope_before[j] += weights[o] * slopes[o]
+
+        affordable = total_budget >= c * (1 - afford_tol)
+        if track:
+            for j in range(n):
+                if not affordable[j] and total_slope[j] > 0:
+                    breakpoint = min(breakpoint, max(c[j] - total_budget[j], 0.0) / abs(total_slope[j]))
+        if not affordable.any():
+            break
+
+        afford = rho / c
+        best_afford = np.inf
+        for j in range(n):
+            if affordable[j] and afford[j] < best_afford:
+                best_afford = afford[j]
+        chosen = -1
+        for j in range(n):
+            if affordable[j] and afford[j] <= best_afford * (1 + tie_tol):
+                if chosen < 0 or name_ranks[remaining[j]] < name_ranks[remaining[chosen]]:
+                    chosen = j
+        project = remaining[chosen]
+        selected[num_selected] = project
+        num_selected += 1
+
+        # how much the budget per voter can grow before a decision of this round may change,
+        # as mes_engine.calc_round_breakpoint with the budgets and slopes before the payments
+        if track:
+            # affordable projects becoming unaffordable
+            for j in range(n):
+                if affordable[j] and total_slope[j] < 0:
+                    breakpoint = min(breakpoint, max(total_budget[j] - c[j], 0.0) / abs(total_slope[j]))
+
+            # supporters switching between paying their whole budget and paying rho
+            for i in range(num_types):
+                o = order[i]
+                for j in range(n):
+                    if not affordable[j] or not types[o, remaining[j]]:
+                        continue
+                    room = rho[j] - budgets[o]
+                    closing = rho_slope[j] - slopes[o]
+                    if i < first[j] and closing < 0:
+                        breakpoint = min(breakpoint, max(room, 0.0) / abs(closing))
+                    elif i >= first[j] and closing > 0:
+                        breakpoint = min(breakpoint, max(-room, 0.0) / abs(closing))
+
+            # another affordable project overtaking the selected one
+            slope_chosen = rho_slope[chosen] / c[chosen]
+            for j in range(n):
+                if not affordable[j] or j == chosen:
+                    continue
+                afford_slope = rho_slope[j] / c[j]
+                lead = afford[j] - afford[chosen]
+                lead_slope = afford_slope - slope_chosen
+                if lead <= tie_tol * afford[chosen]:
+                    if lead_slope < -tie_tol * (abs(afford_slope) + abs(slope_chosen)):
+                        breakpoint = 0.0
+                elif lead_slope < 0:
+                    breakpoint = min(breakpoint, max(lead, 0.0) / abs(lead_slope))
+
+        # supporters sorted before first pay their whole budget, the others pay rho
+        for i in range(num_types):
+            o = order[i]
+            if types[o, project]:
+                if i < first[chosen]:
+                    budgets[o] = 0
+                    if track:
+                        slopes[o] = 0
+                else:
+                    budgets[o] = max(budgets[o] - rho[chosen], 0.0)
+                    if track:
+                        slopes[o] -= rho_slope[chosen]
+
+        # budgets only decrease, so unaffordable projects stay unaffordable
+        keep = affordable.copy()
+        keep[chosen] = False
+        remaining = remaining[keep]
+
+    return selected[:num_selected], breakpoint
+
+
+def mes_rounds(types, multiplicities, costs, voter_budget, name_ranks, candidates, track, afford_tol, tie_tol):
+    selected, breakpoint = kernel(mes_rounds_kernel)(
+        np.ascontiguousarray(types, dtype=np.bool_), np.asarray(multiplicities, dtype=np.float64), np.asarray(costs, dtype=np.float64),
+        float(voter_budget), np.asarray(name_ranks, dtype=np.int64), np.asarray(candidates, dtype=np.bool_), track, afford_tol, tie_tol,
+    )
+
+    return [int(p) for p in selected], breakpoint
+
@@ -0,0 +1,338 @@
+import jit_kernels
+import numpy as np
+import math
+
+# relative tolerance used where pabutools compares exact fractions
+AFFORD_TOL = 1e-9
+TIE_TOL = 1e-9
+# increments are rounded down by this much when jumping, so no breakpoint is skipped
+JUMP_TOL = 1e-6
+
+
+#####
+# deduplicates a voters x projects approval matrix into ballot types
+# returns the distinct ballots and how often each of them appears
+#####
+def ballot_types(approvals):
+
+    approvals = np.asarray(approvals, dtype=bool)
+    types, multiplicities = np.unique(approvals, axis=0, return_counts=True)
+
+    return types, multiplicities
+
+
+#####
+# position of every project name in lexicographic order
+# this is the order pabutools uses to break ties
+#####
+def lexico_ranks(project_names):
+
+    order = sorted(range(len(project_names)), key=lambda p: project_names[p])
+    ranks = np.empty(len(project_names), dtype=np.int64)
+    ranks[order] = np.arange(len(project_names))
+
+    return ranks
+
+
+#####
+# default project names, same as in create_cost_instance
+#####
+def default_project_names(num_projects):
+    return ["p"+str(p) for p in range(num_projects)]
+
+
+#####
+# smallest per-voter payment rho each project needs from its supporters
+# supporters are sorted by budget, under Cost_Sat the order is the same for all projects
+# first is the sorted position of the first supporter that is not fully spent
+# with slopes (derivatives of the budgets w.r.t. the budget per voter)
+# the derivatives of rho and of the total budget are computed too
+#####
+def calc_payments(types, weights, budgets, costs, slopes=None):
+
+    order = np.argsort(budgets, kind='stable')
+    approved = types[order]
+    sorted_budgets = budgets[order]
+
+    supp_w = approved * weights[order][:, None]
+    supp_b = supp_w * sorted_budgets[:, None]
+
+    count_before = np.cumsum(supp_w, axis=0) - supp_w
+    paid_before = np.cumsum(supp_b, axis=0) - supp_b
+    count_left = supp_w.sum(axis=0) - count_before
+    total_budget = supp_b.sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rho = (costs - paid_before) / count_left
+
+    fits = approved & (rho <= sorted_budgets[:, None] + AFFORD_TOL * costs)
+    first = np.argmax(fits, axis=0)
+    cols = np.arange(len(costs))
+    rho = rho[first, cols]
+
+    payments = {
+        'rho': rho,
+        'first': first,
+        'order': order,
+        'approved': approved,
+        'sorted_budgets': sorted_budgets,
+        'total_budget': total_budget,
+    }
+
+    if slopes is not None:
+        supp_s = supp_w * slopes[order][:, None]
+        slope_before = np.cumsum(supp_s, axis=0) - supp_s
+        with np.errstate(divide='ignore', invalid='ignore'):
+            payments['rho_slope'] = -slope_before[first, cols] / count_left[first, cols]
+        payments['total_slope'] = supp_s.sum(axis=0)
+        payments['sorted_slopes'] = slopes[order]
+
+    return payments
+
+
+#####
+# picks the project with the smallest rho/cost among the affordable ones
+# ties are broken by project name like lexico_tie_breaking
+#####
+def select_project(afford, affordable, name_ranks):
+
+    best_afford = afford[affordable].min()
+    tied = np.flatnonzero(affordable & (afford <= best_afford * (1 + TIE_TOL)))
+
+    return tied[np.argmin(name_ranks[tied])]
+
+
+#####
+# smallest positive step of a linear function towards zero
+# value and slope are arrays, only entries selected by mask are used
+#####
+def steps_to_zero(value, slope, mask):
+
+    if not mask.any():
+        return np.inf
+
+    return np.min(np.maximum(value[mask], 0) / np.abs(slope[mask]))
+
+
+#####
+# how much the budget per voter can grow before a decision of this round may change
+# these are the affordability checks, which supporters are fully spent and the selection
+#####
+def calc_round_breakpoint(payments, costs, affordable, chosen):
+
+    rho = payments['rho']
+    rho_slope = payments['rho_slope']
+    total_budget = payments['total_budget']
+    total_slope = payments['total_slope']
+
+    # affordable projects becoming unaffordable, the opposite is checked in mes_rounds
+    breakpoint = steps_to_zero(total_budget - costs, total_slope, affordable & (total_slope < 0))
+
+    # supporters switching between paying their whole budget and paying rho
+    rows = np.arange(len(payments['sorted_budgets']))[:, None]
+    supporters = payments['approved'] & affordable
+    poor = supporters & (rows < payments['first'])
+    rich = supporters & (rows >= payments['first'])
+    room = rho - payments['sorted_budgets'][:, None]
+    closing = rho_slope - payments['sorted_slopes'][:, None]
+
+    breakpoint = min(
+        breakpoint,
+        steps_to_zero(room, closing, poor & (closing < 0)),
+        steps_to_zero(-room, closing, rich & (closing > 0)),
+    )
+
+    # another affordable project overtaking the selected one
+    afford = rho / costs
+    afford_slope = rho_slope / costs
+    lead = afford - afford[chosen]
+    lead_slope = afford_slope - afford_slope[chosen]
+    slope_tol = TIE_TOL * (np.abs(afford_slope) + np.abs(afford_slope[chosen]))
+
+    others = affordable.copy()
+    others[chosen] = False
+    tied = others & (lead <= TIE_TOL * afford[chosen])
+
+    if np.any(tied & (lead_slope < -slope_tol)):
+        return 0.0
+
+    return min(breakpoint, steps_to_zero(lead, lead_slope, others & ~tied & (lead_slope < 0)))
+
+
+#####
+# one run of MES with Cost_Sat for a fixed budget per voter
+# returns the selected projects in selection order
+# with track=True also returns how much the budget per voter can grow
+# before the run might select differently
+# runs the compiled loop version (jit_kernels) when numba is there
+#####
+def mes_rounds(types, multiplicities, costs, voter_budget, name_ranks, candidates, track=False):
+
+    if jit_kernels.enabled:
+        selected, breakpoint = jit_kernels.mes_rounds(types, multiplicities, costs, voter_budget, name_ranks, candidates, track, AFFORD_TOL, TIE_TOL)
+        return (selected, breakpoint) if track else selected
+
+    weights = multiplicities.astype(float)
+    budgets = np.full(len(weights), float(voter_budget))
+    slopes = np.ones(len(weights)) if track else None
+    remaining = np.flatnonzero(candidates)
+    selected = []
+    breakpoint = np.inf
+
+    while len(remaining) > 0:
+        c = costs[remaining]
+        payments = calc_payments(types[:, remaining], weights, budgets, c, slopes)
+
+        affordable = payments['total_budget'] >= c * (1 - AFFORD_TOL)
+        if track:
+            total_slope = payments['total_slope']
+            growing = ~affordable & (total_slope > 0)
+            breakpoint = min(breakpoint, steps_to_zero(c - payments['total_budget'], total_slope, growing))
+        if not affordable.any():
+            break
+
+        rho = payments['rho']
+        chosen = select_project(rho / c, affordable, name_ranks[remaining])
+        project = remaining[chosen]
+        selected.append(int(project))
+
+        if track:
+            breakpoint = min(breakpoint, calc_round_breakpoint(payments, c, affordable, chosen))
+
+        # supporters sorted before first pay their whole budget, the others pay rho
+        order = payments['order']
+        paying = payments['approved'][:, chosen]
+        poor = order[paying & (np.arange(len(order)) < payments['first'][chosen])]
+        rich = order[paying & (np.arange(len(order)) >= payments['first'][chosen])]
+        budgets[poor] = 0
+        budgets[rich] = np.maximum(budgets[rich] - rho[chosen], 0)
+        if track:
+            slopes[poor] = 0
+            slopes[rich] -= payments['rho_slope'][chosen]
+
+        # budgets only decrease, so unaffordable projects stay unaffordable
+        remaining = remaining[affordable & (np.arange(len(remaining)) != chosen)]
+
+    if track:
+        return selected, breakpoint
+    return selected
+
+
+#####
+# checks the stopping conditions of the completion by voter budget increments
+#####
+def is_feasible(costs, outcome, budget_limit):
+    return costs[outcome].sum() <= budget_limit
+
+
+def is_exhaustive(costs, outcome, budget_limit, available):
+    spent = costs[outcome].sum()
+    left = available.copy()
+    left[outcome] = False
+    return not np.any(costs[left] + spent <= budget_limit)
+
+
+#####
+# Method of Equal Shares with Cost_Sat on arrays
+# types: ballot types x projects boolean approvals, multiplicities: count of each type
+# voter_budget_increment behaves like in pabutools' method_of_equal_shares
+# completion="jump" skips the increments after which the outcome cannot have changed yet,
+# completion="increment" reruns the rule after every single increment
+# returns the indices of the selected projects
+#####
+def mes_cost_sat(types, multiplicities, costs, budget_limit, project_names=None, voter_budget_increment=None, completion="jump"):
+
+    if completion not in ("jump", "increment"):
+        raise ValueError(f"unknown completion mode {completion}")
+
+    types = np.asarray(types, dtype=bool)
+    multiplicities = np.asarray(multiplicities, dtype=np.int64)
+    costs = np.asarray(costs)
+    num_projects = len(costs)
+
+    if project_names is None:
+        project_names = default_project_names(num_projects)
+    name_ranks = lexico_ranks(project_names)
+
+    num_votes = int(multiplicities.sum())
+    if num_votes == 0:
+        return []
+
+    # like pabutools, projects that cost nothing give no satisfaction under Cost_Sat and are never selected
+    supported = (types & (multiplicities > 0)[:, None]).any(axis=0)
+    candidates = supported & (costs > 0)
+
+    if voter_budget_increment is None:
+        return mes_rounds(types, multiplicities, costs, budget_limit / num_votes, name_ranks, candidates)
+
+    track = completion == "jump"
+    previous_outcome = []
+    increments = 0
+
+    while True:
+        voter_budget = budget_limit / num_votes + increments * voter_budget_increment
+
+        if track:
+            selected, breakpoint = mes_rounds(types, multiplicities, costs, voter_budget, name_ranks, candidates, track=True)
+        else:
+            selected = mes_rounds(types, multiplicities, costs, voter_budget, name_ranks, candidates)
+        outcome = selected
+
+        if not is_feasible(costs, outcome, budget_limit):
+            return previous_outcome
+        if is_exhaustive(costs, outcome, budget_limit, candidates):
+            return outcome
+
+        # the outcome stays the same up to the breakpoint, so the increments before it
+        # would all end in the checks above with the same result
+        if track and np.isfinite(breakpoint):
+            increments += max(1, math.ceil(breakpoint / voter_budget_increment - JUMP_TOL))
+        else:
+            increments += 1
+        previous_outcome = outcome
+
+
+#####
+# converts a pabutools instance and profile into arrays
+# projects are ordered by name, profiles and multiprofiles both work
+#####
+def instance_to_arrays(instance, profile):
+
+    projects = sorted(instance)
+    index = {p.name: i for i, p in enumerate(projects)}
+
+    ballots = []
+    multiplicities = []
+    for ballot in profile:
+        row = np.zeros(len(projects), dtype=bool)
+        for project in ballot:
+            row[index[project.name]] = True
+        ballots.append(row)
+        multiplicities.append(profile.multiplicity(ballot))
+
+    types = np.array(ballots, dtype=bool).reshape(len(ballots), len(projects))
+    costs = np.array([int(p.cost) if int(p.cost) == p.cost else float(p.cost) for p in projects])
+
+    return projects, types, np.array(multiplicities, dtype=np.int64), costs
+
+
+#####
+# drop-in replacement for pabutools' method_of_equal_shares with Cost_Sat
+# sat_class=None is Cost_Sat, pabutools is only imported here so the array engine loads without it
+#####
+def method_of_equal_shares_fast(instance, profile, sat_class=None, voter_budget_increment=None, completion="jump"):
+    from pabutools.election import Cost_Sat
+    from pabutools.rules import BudgetAllocation
+
+    if sat_class is not None and sat_class is not Cost_Sat:
+        raise ValueError("method_of_equal_shares_fast only supports Cost_Sat")
+
+    projects, types, multiplicities, costs = instance_to_arrays(instance, profile)
+    budget_limit = instance.budget_limit
+    if int(budget_limit) == budget_limit:
+        budget_limit = int(budget_limit)
+
+    outcome = mes_cost_sat(types, multiplicities, costs, budget_limit, [p.name for p in projects], voter_budget_increment, completion)
+
+    return BudgetAllocation([projects[p] for p in outcome])
+
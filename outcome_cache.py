@@ -0,0 +1,201 @@
+from ballot_data import mes_outcome, greedy_outcomes
+from instrumentation import measured
+import numpy as np
+import hashlib
+import time
+import os
+
+CACHE_VERSION = 2
+
+# the cache is off unless OUTCOME_CACHE_DIR names a folder, e.g. ~/.cache/CostBiasInPB/outcomes
+# (cli.py --cache-dir sets it, so worker processes of any start method see the same folder)
+CACHE_FOLDER = os.path.expanduser(os.environ.get("OUTCOME_CACHE_DIR", ""))
+CACHE_MAX_BYTES = int(os.environ.get("OUTCOME_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# bytes this process wrote since its last eviction sweep
+# a process sweeps after writing max_bytes / 16, short runs never scan the cache
+written_since_sweep = 0
+
+
+#####
+# hash of everything in the ballot data the rules depend on
+# the deduplicated ballots, the approval counts and the project names (tie-breaking)
+#####
+def ballot_key(ballot_data):
+    h = hashlib.sha256()
+    h.update(repr(tuple(ballot_data.project_names)).encode('utf-8'))
+
+    for array in (ballot_data.types, ballot_data.multiplicities, ballot_data.counts):
+        array = np.ascontiguousarray(array, dtype=np.int64)
+        h.update(repr(array.shape).encode('utf-8'))
+        h.update(array.tobytes())
+
+    return h.hexdigest()
+
+
+#####
+# key of the outcome file of a rule with its parameters on one ballot data
+# the file holds the outcomes of every cost vector and budget solved so far
+#####
+def outcome_key(ballot_hash, rule, params):
+    return hashlib.sha256(f"{CACHE_VERSION};{rule};{sorted(params.items())!r};{ballot_hash}".encode('utf-8')).hexdigest()
+
+
+#####
+# file of a key, spread over 256 sub folders
+#####
+def cache_path(folder, key):
+    return os.path.join(folder, key[:2], key + ".npz")
+
+
+#####
+# row of a cost vector and budget in an outcome file
+# integer and float costs of the same value give the same row
+#####
+def row_key(costs, budget):
+    return np.float64(budget).tobytes() + np.ascontiguousarray(costs, dtype=np.float64).tobytes()
+
+
+#####
+# cached outcomes of a key as a dict from row_key to selection mask, empty if there are none
+# a hit counts as a use for the LRU eviction
+#####
+def load_outcomes(folder, key):
+    path = cache_path(folder, key)
+
+    try:
+        with np.load(path) as stored:
+            costs, budgets, masks = stored['costs'], stored['budgets'], stored['masks']
+        os.utime(path)
+    except (OSError, ValueError, EOFError, KeyError):
+        return {}
+
+    return {row_key(c, b): mask for c, b, mask in zip(costs, budgets, masks)}
+
+
+#####
+# stores the outcomes of a key, all rows in one file
+# written to a file of its own first and renamed, so concurrent readers never see half a file
+# concurrent writers of the same key can drop each other's new rows, which only costs their recomputation
+#####
+def store_outcomes(folder, key, costs, budgets, masks, max_bytes=CACHE_MAX_BYTES):
+    global written_since_sweep
+
+    path = cache_path(folder, key)
+    tmp_path = f"{path}.{os.getpid()}.{os.urandom(4).hex()}.tmp"
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, costs=np.asarray(costs, dtype=np.float64), budgets=np.asarray(budgets, dtype=np.float64), masks=np.asarray(masks, dtype=bool))
+        size = disk_bytes(os.stat(tmp_path))
+        os.replace(tmp_path, path)
+    except OSError:
+        # a cache that cannot be written only costs the recomputation
+        return
+
+    written_since_sweep += size
+    if written_since_sweep > max_bytes // 16:
+        evict(folder, max_bytes)
+        written_since_sweep = 0
+
+
+#####
+# space a file takes on disk, whole blocks rather than its length
+#####
+def disk_bytes(stat):
+    return stat.st_blocks * 512
+
+
+#####
+# deletes the least recently used outcome files until the cache is below 90% of max_bytes
+# files removed by another process in the meantime are skipped,
+# temporary files are only removed once they are too old to belong to a running writer
+#####
+def evict(folder, max_bytes=CACHE_MAX_BYTES):
+    entries = []
+    now = time.time()
+
+    for shard in os.scandir(folder):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".tmp"):
+                    if now - stat.st_mtime > 3600:
+                        os.remove(entry.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, disk_bytes(stat), entry.path))
+
+    total = sum(size for mtime, size, path in entries)
+    if total <= max_bytes:
+        return
+
+    entries.sort()
+    for mtime, size, path in entries:
+        if total <= 0.9 * max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+#####
+# outcomes of a rule for all rows of a cost matrix, one row per variant
+# solve(cost_matrix) calculates the selection masks of the rows that are not cached yet
+#####
+def cached_outcomes(ballot_data, cost_matrix, budget, rule, params, solve, folder=None):
+    cost_matrix = np.atleast_2d(cost_matrix)
+    folder = CACHE_FOLDER if folder is None else folder
+    if not folder:
+        return solve(cost_matrix)
+
+    key = outcome_key(ballot_key(ballot_data), rule, params)
+    stored = load_outcomes(folder, key)
+    rows = [row_key(costs, budget) for costs in cost_matrix]
+    outcomes = np.zeros(cost_matrix.shape, dtype=bool)
+    missing = []
+
+    for row, rkey in enumerate(rows):
+        mask = stored.get(rkey)
+        if mask is None or mask.shape != (cost_matrix.shape[1],):
+            missing.append(row)
+        else:
+            outcomes[row] = mask
+
+    if missing:
+        outcomes[missing] = solve(cost_matrix[missing])
+        for row in missing:
+            stored[rows[row]] = outcomes[row]
+        # the ballot data fixes the number of projects, so all rows of a key stack
+        budgets_costs = np.array([np.frombuffer(rkey, dtype=np.float64) for rkey in stored])
+        store_outcomes(folder, key, budgets_costs[:, 1:], budgets_costs[:, 0], list(stored.values()))
+
+    return outcomes
+
+
+#####
+# MES outcomes for all rows of a cost matrix, same settings as ballot_data.mes_outcome
+#####
+def cached_mes_outcomes(ballot_data, cost_matrix, budget_limit, voter_budget_increment=1, folder=None):
+
+    def solve(costs):
+        return np.array([measured('mes', 1, mes_outcome, ballot_data, row, budget_limit, voter_budget_increment) for row in costs])
+
+    return cached_outcomes(ballot_data, cost_matrix, budget_limit, "mes_cost_sat", {'voter_budget_increment': voter_budget_increment}, solve, folder)
+
+
+#####
+# greedy outcomes for all rows of a cost matrix, same as ballot_data.greedy_outcomes
+#####
+def cached_greedy_outcomes(ballot_data, cost_matrix, budget_limit, folder=None):
+
+    def solve(costs):
+        return measured('greedy', len(costs), greedy_outcomes, ballot_data, costs, budget_limit)
+
+    return cached_outcomes(ballot_data, cost_matrix, budget_limit, "greedy_cost_sat", {}, solve, folder)
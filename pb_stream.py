@@ -0,0 +1,122 @@
+from collections import namedtuple
+from contextlib import closing
+from array import array
+from ballot_data import ballot_data_from_csr
+import numpy as np
+import csv
+
+SECTIONS = ("meta", "projects", "votes")
+
+#####
+# contents of a pabulib file as arrays
+# costs are in file order, indptr/indices are the approvals as CSR (None in header-only mode)
+#####
+PabulibArrays = namedtuple('PabulibArrays', ['meta', 'budget', 'project_names', 'costs', 'project_meta', 'indptr', 'indices'])
+
+
+#####
+# number from a pabulib field, int if it has no fractional part
+#####
+def parse_number(value):
+
+    number = float(value.strip().replace(",", "."))
+    if number.is_integer():
+        return int(number)
+
+    return number
+
+
+#####
+# streams a pabulib file row by row
+# yields (section, header, row), nothing is read ahead
+#####
+def iter_rows(file):
+
+    with open(file, 'r', newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f, delimiter=';')
+        section = ""
+        header = []
+
+        for row in reader:
+            if len(row) == 0 or (len(row) == 1 and len(row[0].strip()) == 0):
+                continue
+            if row[0].strip().lower() in SECTIONS:
+                section = row[0].strip().lower()
+                header = [key.strip() for key in next(reader)]
+                continue
+            yield section, header, row
+
+
+#####
+# reads a pabulib approval file into arrays
+# header_only=True stops at the VOTES section, e.g. when only costs and budget are needed
+#####
+def read_pabulib(file, header_only=False):
+
+    meta = {}
+    project_names = []
+    costs = []
+    project_meta = {}
+    index = {}
+
+    indptr = array('q', [0])
+    indices = array('q')
+    vote_column = None
+
+    with closing(iter_rows(file)) as rows:
+        for section, header, row in rows:
+
+            if section == "meta":
+                meta[row[0].strip()] = row[1].strip()
+
+            elif section == "projects":
+                fields = {header[i]: row[i].strip() for i in range(len(row))}
+                name = row[0].strip()
+                index[name] = len(project_names)
+                project_names.append(name)
+                costs.append(parse_number(fields["cost"]))
+                project_meta[name] = fields
+
+            elif section == "votes":
+                if header_only:
+                    break
+                if vote_column is None:
+                    vote_column = header.index("vote")
+                for name in row[vote_column].split(","):
+                    if name:
+                        indices.append(index[name.strip()])
+                indptr.append(len(indices))
+
+    costs = np.array(costs)
+    budget = parse_number(meta["budget"]) if "budget" in meta else None
+
+    if header_only:
+        return PabulibArrays(meta, budget, project_names, costs, project_meta, None, None)
+
+    return PabulibArrays(
+        meta, budget, project_names, costs, project_meta,
+        np.frombuffer(indptr, dtype=np.int64), np.frombuffer(indices, dtype=np.int64),
+    )
+
+
+#####
+# reads a pabulib approval file and builds its ballot data
+#####
+def load_ballot_data(file):
+
+    arrays = read_pabulib(file)
+    ballot_data = ballot_data_from_csr(arrays.indptr, arrays.indices, len(arrays.project_names), arrays.project_names)
+
+    return ballot_data, arrays
+
+
+#####
+# votes/possible approvals of the selected projects, appended to ratio
+# same as sel_pop_stat.cost_over_budget for the arrays and a selection mask
+#####
+def selected_ratio(arrays, in_outcome, ratio):
+    for p, name in enumerate(arrays.project_names):
+        if in_outcome[p]:
+            ratio.append(int(arrays.project_meta[name]['votes'])/int(arrays.meta['num_votes']))
+
+    return ratio
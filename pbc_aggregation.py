@@ -0,0 +1,118 @@
+from collections import namedtuple
+import pandas as pd
+import numpy as np
+
+#####
+# running statistics of a results csv per var (Welford)
+# vars: the var values, columns: the statistic columns
+# count/mean/m2: vars x columns, m2 is the sum of squared deviations from the mean
+# nan values are skipped like in pandas, so the count can differ between columns
+#####
+Aggregates = namedtuple('Aggregates', ['vars', 'columns', 'count', 'mean', 'm2'])
+
+
+#####
+# empty aggregates for the given statistic columns
+#####
+def empty_aggregates(columns):
+    shape = (0, len(columns))
+
+    return Aggregates(np.zeros(0, dtype=np.int64), list(columns), np.zeros(shape), np.zeros(shape), np.zeros(shape))
+
+
+#####
+# count, mean and m2 per var of one chunk of rows
+# var: one value per row, values: rows x columns
+#####
+def chunk_aggregates(var, values, columns):
+    vars, group = np.unique(np.asarray(var, dtype=np.int64), return_inverse=True)
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    values = np.where(valid, values, 0)
+
+    count = np.zeros((len(vars), len(columns)))
+    total = np.zeros((len(vars), len(columns)))
+    np.add.at(count, group, valid)
+    np.add.at(total, group, values)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, 0)
+    deviation = np.where(valid, values - mean[group], 0)
+    m2 = np.zeros((len(vars), len(columns)))
+    np.add.at(m2, group, deviation * deviation)
+
+    return Aggregates(vars, list(columns), count, mean, m2)
+
+
+#####
+# combines the aggregates of two disjoint sets of rows (Chan et al.)
+#####
+def merge_aggregates(a, b):
+    vars = np.union1d(a.vars, b.vars)
+    shape = (len(vars), len(a.columns))
+    count, mean, m2 = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+
+    ia = np.searchsorted(vars, a.vars)
+    count[ia], mean[ia], m2[ia] = a.count, a.mean, a.m2
+
+    ib = np.searchsorted(vars, b.vars)
+    n_a, n_b = count[ib], b.count
+    n = n_a + n_b
+    delta = b.mean - mean[ib]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean[ib] = np.where(n > 0, mean[ib] + delta * n_b / n, 0)
+        m2[ib] = np.where(n > 0, m2[ib] + b.m2 + delta * delta * n_a * n_b / n, 0)
+    count[ib] = n
+
+    return Aggregates(vars, list(a.columns), count, mean, m2)
+
+
+#####
+# aggregates data frames with a var column and statistic columns, one chunk at a time
+#####
+def aggregate_frames(frames, aggregates=None):
+    for frame in frames:
+        columns = [column for column in frame.columns if column != 'var']
+        if aggregates is None:
+            aggregates = empty_aggregates(columns)
+        aggregates = merge_aggregates(aggregates, chunk_aggregates(frame['var'].to_numpy(), frame[aggregates.columns].to_numpy(), aggregates.columns))
+
+    return aggregates
+
+
+#####
+# aggregates a results csv in chunks of chunksize rows, the memory does not grow with the file
+#####
+def aggregate_csv(csv_file, chunksize=1_000_000):
+    with pd.read_csv(csv_file, chunksize=chunksize) as reader:
+        return aggregate_frames(reader)
+
+
+#####
+# means per var as a data frame, same as df.groupby('var').mean().reset_index()
+#####
+def mean_frame(aggregates):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(aggregates.count > 0, aggregates.mean, np.nan)
+
+    frame = pd.DataFrame(means, columns=aggregates.columns)
+    frame.insert(0, 'var', aggregates.vars)
+
+    return frame
+
+
+#####
+# summary table per var: mean, standard deviation (ddof=1) and count of every statistic
+#####
+def summary_frame(aggregates):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(aggregates.count > 0, aggregates.mean, np.nan)
+        std = np.where(aggregates.count > 1, np.sqrt(aggregates.m2 / (aggregates.count - 1)), np.nan)
+
+    frame = pd.DataFrame({'var': aggregates.vars})
+    for c, column in enumerate(aggregates.columns):
+        frame[column + '_mean'] = means[:, c]
+        frame[column + '_std'] = std[:, c]
+        frame[column + '_count'] = aggregates.count[:, c].astype(np.int64)
+
+    return frame
@@ -0,0 +1,71 @@
+import pandas as pd
+import numpy as np
+
+
+#####
+# per election values of a results csv, read in chunks
+# every election has one row per var, the k-th row of a var belongs to election k
+# returns the vars (sorted), the statistic columns and an elections x vars x columns array
+# (nan where an election has no row for a var)
+#####
+def election_matrix(csv_file, chunksize=1_000_000):
+    seen = pd.Series(dtype=np.int64)
+    chunks = []
+    columns = None
+
+    with pd.read_csv(csv_file, chunksize=chunksize) as reader:
+        for frame in reader:
+            if columns is None:
+                columns = [column for column in frame.columns if column != 'var']
+            var = frame['var'].astype(np.int64)
+            election = frame.groupby('var').cumcount().to_numpy() + var.map(seen).fillna(0).to_numpy(dtype=np.int64)
+            seen = seen.add(var.value_counts(), fill_value=0).astype(np.int64)
+            chunks.append((var.to_numpy(), election, frame[columns].to_numpy(dtype=float)))
+
+    vars = np.array(sorted(seen.index), dtype=np.int64)
+    num_elections = int(seen.max()) if len(seen) else 0
+    data = np.full((num_elections, len(vars), len(columns or [])), np.nan)
+    for var, election, values in chunks:
+        data[election, np.searchsorted(vars, var)] = values
+
+    return vars, columns, data
+
+
+#####
+# bootstrap means per var and column, resampling whole elections with replacement
+# data: elections x vars x columns, nan values are left out of the means
+# each batch draws a resamples x elections index matrix at once, the means of all resamples
+# are then one matrix product of the resample multiplicities with the data
+# returns a resamples x vars x columns array
+#####
+def bootstrap_means(data, num_resamples=1000, seed=None, batch_size=256):
+    rng = np.random.default_rng(seed)
+    num_elections = data.shape[0]
+    flat = data.reshape(num_elections, -1)
+    valid = ~np.isnan(flat)
+    values = np.where(valid, flat, 0)
+    has_nan = not valid.all()
+
+    means = np.empty((num_resamples, flat.shape[1]))
+    for start in range(0, num_resamples, batch_size):
+        size = min(batch_size, num_resamples - start)
+        index = rng.integers(0, num_elections, (size, num_elections))
+        offsets = np.arange(size)[:, None] * num_elections
+        weights = np.bincount((index + offsets).ravel(), minlength=size * num_elections).reshape(size, num_elections).astype(float)
+
+        total = weights @ values
+        count = weights @ valid if has_nan else np.full_like(total, num_elections)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means[start:start + size] = total / count
+
+    return means.reshape((num_resamples,) + data.shape[1:])
+
+
+#####
+# lower and upper percentile of the bootstrap samples for a confidence level
+# samples: resamples x ... (e.g. the means of one column, or a difference of two columns)
+#####
+def percentile_band(samples, confidence=0.95):
+    alpha = (1 - confidence) / 2 * 100
+
+    return np.nanpercentile(samples, alpha, axis=0), np.nanpercentile(samples, 100 - alpha, axis=0)
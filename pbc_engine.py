@@ -0,0 +1,36 @@
+from scipy import special
+import numpy as np
+
+
+#####
+# point-biserial correlation for many instances at once
+# outcomes, covariates: instances x projects (a single row is broadcast)
+# returns the correlations and the two-sided p-values (t-distribution with n - 2 degrees of freedom)
+# same values as scipy.stats.pointbiserialr row by row, rows where the outcome or
+# the covariate is constant (nothing or everything selected) give nan for both
+#####
+def point_biserial(outcomes, covariates):
+
+    x, y = np.broadcast_arrays(np.atleast_2d(np.asarray(outcomes, dtype=float)), np.atleast_2d(np.asarray(covariates, dtype=float)))
+    n = x.shape[-1]
+    if n < 2:
+        raise ValueError("point_biserial needs at least 2 projects")
+
+    constant = np.all(x == x[:, :1], axis=-1) | np.all(y == y[:, :1], axis=-1)
+
+    xm = x - x.mean(axis=-1, keepdims=True)
+    ym = y - y.mean(axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        xm = xm / np.linalg.norm(xm, axis=-1, keepdims=True)
+        ym = ym / np.linalg.norm(ym, axis=-1, keepdims=True)
+        r = np.clip(np.einsum('ij,ij->i', xm, ym), -1, 1)
+    r[constant] = np.nan
+
+    # P(|T| >= |t|) with t = r * sqrt(df / (1 - r^2)) is the regularized incomplete beta at 1 - r^2
+    if n == 2:
+        p = np.where(constant, np.nan, 1.0)
+    else:
+        p = special.betainc((n - 2) / 2, 0.5, 1 - r * r)
+
+    return r, p
+
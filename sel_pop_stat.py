@@ -4,8 +4,10 @@ from pabutools.election import Project, ApprovalBallot, ApprovalProfile, Cost_Sa
 from collections import defaultdict
 import os
 import matplotlib.pyplot as plt
-from pabutools.rules import greedy_utilitarian_welfare
-from pabutools.rules import method_of_equal_shares
+from ballot_data import ballot_data_from_profile
+from outcome_cache import cached_mes_outcomes, cached_greedy_outcomes
+from pb_stream import load_ballot_data, selected_ratio
+import numpy as np
 
 def load_instance(file):
 
@@ -14,9 +16,21 @@ def load_instance(file):
     return instance, profile
 
 
+#####
+# calculates the outcomes of both rules from one shared ballot data
+# outcomes that were calculated before come from the outcome cache
+#####
 def calc_outcomes(instance, profile):
-    outcome_MES = method_of_equal_shares(instance, profile.as_multiprofile(), sat_class=Cost_Sat, voter_budget_increment=1)
-    outcome_greedy = greedy_utilitarian_welfare(instance, profile.as_multiprofile(), sat_class=Cost_Sat)
+    projects = sorted(instance)
+    ballot_data = ballot_data_from_profile(profile, [p.name for p in projects])
+    costs = np.array([float(p.cost) for p in projects])
+    budget = float(instance.budget_limit)
+
+    in_outcome_MES = cached_mes_outcomes(ballot_data, costs, budget)[0]
+    in_outcome_greedy = cached_greedy_outcomes(ballot_data, costs, budget)[0]
+
+    outcome_MES = [p for p, selected in zip(projects, in_outcome_MES) if selected]
+    outcome_greedy = [p for p, selected in zip(projects, in_outcome_greedy) if selected]
 
     return outcome_MES, outcome_greedy
 
@@ -34,12 +48,14 @@ def cost_over_budget(instance,outcome, ratio):
 # for both greedy and MES
 #####
 def sel_popular(filename, ratio_sel_greedy, ratio_sel_MES):
-    instance, profile = load_instance(filename)
-    outcome_MES, outcome_greedy = calc_outcomes(instance, profile)
+    ballot_data, arrays = load_ballot_data(filename)
+
+    in_outcome_MES = cached_mes_outcomes(ballot_data, arrays.costs, arrays.budget)[0]
+    in_outcome_greedy = cached_greedy_outcomes(ballot_data, arrays.costs, arrays.budget)[0]
 
-    ratio_sel_greedy = cost_over_budget(instance, outcome_greedy, ratio_sel_greedy)
+    ratio_sel_greedy = selected_ratio(arrays, in_outcome_greedy, ratio_sel_greedy)
 
-    ratio_sel_MES = cost_over_budget(instance, outcome_MES, ratio_sel_MES)
+    ratio_sel_MES = selected_ratio(arrays, in_outcome_MES, ratio_sel_MES)
 
 
     return ratio_sel_greedy, ratio_sel_MES
@@ -0,0 +1,285 @@
+from instance_catalog import InstanceCatalog, evaluate_catalog_election
+from create_many_instances import election_seeds
+from create_pbc_csv import CSV_HEADER, ordered_map
+from functools import partial
+import numpy as np
+import socket
+import uuid
+import glob
+import json
+import time
+import csv
+import os
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+#####
+# a sweep split into shards for many workers on a shared filesystem
+# <folder>/manifest.json: the sweep parameters, the master seed and the shards (election ranges)
+# <folder>/locks/shard_<id>.lock: the lease of the worker evaluating a shard, its mtime is the last heartbeat
+# <folder>/results/shard_<id>.csv: the rows of a finished shard, written atomically
+# through shard_<id>.csv.<token>.tmp, the tmp files of crashed workers are removed on takeover
+# election e of the sweep is always generated from SeedSequence(seed, spawn_key=(e,)) (see instance_catalog),
+# so a shard evaluates to the same rows on any node, and evaluating it twice does no harm
+# shards are evaluated at least once, not exactly once: a worker only notices that its lease was taken over
+# when it renews after its current election, and a reclaim can race with a late renewal, so for a while
+# two workers may evaluate the same shard. both write the same rows, the result file is replaced atomically
+#####
+
+
+#####
+# splits a sweep of num_elections elections into shards of shard_size elections and writes the manifest
+# seed=None draws a master seed, it is stored in the manifest
+# returns the manifest
+#####
+def create_manifest(folder, num_elections, shard_size, num_votes, num_projects, budget, num_profiles,
+                    prop_prob_start=1, prop_prob_step=0.025, seed=None, ballot_chunk_size=None):
+    master_seed, _ = election_seeds(seed, 0)
+    catalog = InstanceCatalog(master_seed, num_elections, num_votes, num_projects, budget, num_profiles, prop_prob_start, prop_prob_step, ballot_chunk_size)
+
+    shards = [{'id': s, 'start': start, 'stop': min(start + shard_size, num_elections)} for s, start in enumerate(range(0, num_elections, shard_size))]
+    manifest = {'version': MANIFEST_VERSION, 'catalog': catalog._asdict(), 'shards': shards}
+
+    os.makedirs(os.path.join(folder, "locks"), exist_ok=True)
+    os.makedirs(os.path.join(folder, "results"), exist_ok=True)
+    with open(os.path.join(folder, MANIFEST_FILE + ".tmp"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(folder, MANIFEST_FILE + ".tmp"), os.path.join(folder, MANIFEST_FILE))
+
+    return manifest
+
+
+def load_manifest(folder):
+    with open(os.path.join(folder, MANIFEST_FILE), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest['version'] != MANIFEST_VERSION:
+        raise ValueError(f"manifest version {manifest['version']} is not supported")
+
+    return manifest
+
+
+def lock_path(folder, shard):
+    return os.path.join(folder, "locks", f"shard_{shard['id']}.lock")
+
+
+def result_path(folder, shard):
+    return os.path.join(folder, "results", f"shard_{shard['id']}.csv")
+
+
+#####
+# token of a lock file, None if it does not exist (any more)
+#####
+def read_token(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['token']
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+#####
+# removes the partial result files of a shard that were not written to for lease_seconds
+# the worker holding a lease flushes its file after every election, before it renews, so these
+# belong to a crashed worker or to one that lost its lease
+#####
+def remove_stale_results(folder, shard, lease_seconds):
+    for tmp_path in glob.glob(glob.escape(result_path(folder, shard)) + ".*.tmp"):
+        try:
+            age = time.time() - os.stat(tmp_path).st_mtime
+        except FileNotFoundError:
+            continue
+        if age > lease_seconds:
+            remove_file(tmp_path)
+
+
+#####
+# tries to take the lease of a shard, returns the lease token or None if another worker holds it
+# a lock whose mtime is older than lease_seconds belongs to a crashed worker: it is renamed away,
+# which only one worker can do, and then claimed like a free shard, the partial results of its holder are removed
+# the age is taken from the filesystem clock, the nodes' clocks should not be far apart
+#####
+def try_claim(folder, shard, worker, lease_seconds):
+    path = lock_path(folder, shard)
+
+    try:
+        age = time.time() - os.stat(path).st_mtime
+    except FileNotFoundError:
+        age = None
+
+    if age is not None:
+        if age <= lease_seconds:
+            return None
+        stale_path = f"{path}.stale-{uuid.uuid4().hex}"
+        try:
+            os.rename(path, stale_path)
+        except FileNotFoundError:
+            return None
+        # renewals touch the lock itself (see renew), so the renamed file shows whether its holder
+        # renewed or a new holder claimed between the stat and the rename
+        # then it goes back, over a lock a third worker may have created meanwhile: that worker
+        # loses its lease at its next renewal, not the one that renewed in time
+        if time.time() - os.stat(stale_path).st_mtime <= lease_seconds:
+            os.replace(stale_path, path)
+            return None
+        os.remove(stale_path)
+        remove_stale_results(folder, shard, lease_seconds)
+
+    token = uuid.uuid4().hex
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'token': token, 'worker': worker, 'host': socket.gethostname(), 'pid': os.getpid(), 'claimed': time.time()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    return token
+
+
+#####
+# renews the lease of a shard, False if the lease was lost (it expired and another worker took the shard)
+# the token is checked and the mtime set through the same open file, so a renewal can only ever
+# touch this worker's own lock, even if it is renamed away or replaced in between
+#####
+def renew(folder, shard, token):
+    try:
+        with open(lock_path(folder, shard), encoding='utf-8') as f:
+            if json.load(f).get('token') != token:
+                return False
+            os.utime(f.fileno())
+    except (FileNotFoundError, ValueError):
+        return False
+
+    return True
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+#####
+# gives a lease up, the lock is only removed if it is still ours
+#####
+def release(folder, shard, token):
+    path = lock_path(folder, shard)
+    if read_token(path) == token:
+        remove_file(path)
+
+
+#####
+# evaluates the elections of a shard and writes its result file atomically
+# the lease is renewed after every election, so one election has to take less than the lease timeout
+# returns False if the lease was lost on the way (the other worker writes the same rows)
+#####
+def evaluate_shard(folder, manifest, shard, token, num_workers=1):
+    catalog = InstanceCatalog(**manifest['catalog'])
+    elections = range(shard['start'], shard['stop'])
+    path = result_path(folder, shard)
+    tmp_path = path + f".{token}.tmp"
+
+    with open(tmp_path, 'w', newline='') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(CSV_HEADER)
+
+        for e, rows in zip(elections, ordered_map(partial(evaluate_catalog_election, catalog), elections, num_workers)):
+            csvwriter.writerows(rows)
+            csvfile.flush()
+            if not renew(folder, shard, token):
+                csvfile.close()
+                remove_file(tmp_path)
+                return False
+
+        csvfile.flush()
+        os.fsync(csvfile.fileno())
+
+    # the worker that took the shard over may have removed the file already
+    try:
+        os.replace(tmp_path, path)
+    except FileNotFoundError:
+        return False
+
+    return True
+
+
+#####
+# the shards without a result file
+#####
+def open_shards(folder, manifest):
+    return [shard for shard in manifest['shards'] if not os.path.exists(result_path(folder, shard))]
+
+
+#####
+# claims and evaluates shards until none is left to claim
+# shards leased by other workers are skipped, with wait=True the worker polls every poll_seconds
+# until they are finished or their lease expired (and takes them over)
+# returns the ids of the shards this worker finished
+#####
+def run_worker(folder, worker=None, lease_seconds=600, num_workers=1, max_shards=None, wait=False, poll_seconds=30):
+    manifest = load_manifest(folder)
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    finished = []
+
+    while max_shards is None or len(finished) < max_shards:
+        shards = open_shards(folder, manifest)
+        if not shards:
+            break
+
+        claimed = None
+        for shard in shards:
+            token = try_claim(folder, shard, worker, lease_seconds)
+            if token is not None:
+                claimed = shard, token
+                break
+
+        if claimed is None:
+            if not wait:
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        shard, token = claimed
+        # another worker may have finished it between the listing and the claim
+        if not os.path.exists(result_path(folder, shard)) and evaluate_shard(folder, manifest, shard, token, num_workers):
+            finished.append(shard['id'])
+            print(worker, "shard", shard['id'])
+        release(folder, shard, token)
+
+    return finished
+
+
+#####
+# combines the shard results in shard order into the final table
+# output_format="csv": the csv of create_pbc_csv, "npz": one array per column (np.load gives them by name)
+# raises if a shard is not finished yet
+#####
+def merge_shards(folder, output_file, output_format="csv"):
+    if output_format not in ("csv", "npz"):
+        raise ValueError(f"unknown output format {output_format}")
+
+    manifest = load_manifest(folder)
+    missing = [shard['id'] for shard in open_shards(folder, manifest)]
+    if missing:
+        raise ValueError(f"shards {missing} are not finished")
+
+    if output_format == "npz":
+        rows = [np.loadtxt(result_path(folder, shard), delimiter=',', skiprows=1, ndmin=2) for shard in manifest['shards']]
+        table = np.concatenate(rows)
+        columns = {column: table[:, c] for c, column in enumerate(CSV_HEADER)}
+        columns['var'] = columns['var'].astype(np.int64)
+        columns['election'] = np.repeat(np.arange(manifest['catalog']['num_elections']), manifest['catalog']['num_profiles'])
+        with open(output_file, 'wb') as f:
+            np.savez(f, **columns)
+        return
+
+    with open(output_file, 'w', newline='') as out:
+        csv.writer(out).writerow(CSV_HEADER)
+        for shard in manifest['shards']:
+            with open(result_path(folder, shard), newline='') as f:
+                f.readline()
+                out.write(f.read())
@@ -3,14 +3,17 @@ from pabutools.election import parse_pabulib
 from pabutools.election import write_pabulib
 from pabutools.election import Project, ApprovalBallot, ApprovalProfile, Cost_Sat, Instance
 from collections import defaultdict
+from cost_matrix import create_cost_matrix_sweep, iter_cost_instances, counts_array
+from histogram_rendering import render_all
 import random
 import numpy as np
 import os
 import datetime
 import matplotlib.pyplot as plt
-from pabutools.rules import greedy_utilitarian_welfare
-from pabutools.rules import method_of_equal_shares
-import scipy.stats as stats
+from ballot_data import ballot_data_from_profile
+from outcome_cache import cached_mes_outcomes, cached_greedy_outcomes
+from pbc_engine import point_biserial
+from instrumentation import recording, stage, add_instances
 import copy
 
 def get_current_datetime():
@@ -27,13 +30,8 @@ def create_ballots(num_votes, num_projects):
 
     created_ballots = ps.disjoint_resampling(num_votes,num_projects,0.75,0.125,num_central_votes=4)
 
-    number_counts = defaultdict(int)
-
-    for number_set in created_ballots:
-        for number in number_set:
-            number_counts[number] += 1
-
-    sorted_counts = dict(sorted(number_counts.items()))
+    counts = np.bincount([number for number_set in created_ballots for number in number_set], minlength=num_projects)
+    sorted_counts = {int(p): int(counts[p]) for p in np.flatnonzero(counts)}
 
     return created_ballots, sorted_counts
 
@@ -75,14 +73,8 @@ def create_cost_instance(budget, prop_prob, num_projects, sorted_counts, num_vot
 ######
 def create_list_cost_instances(num_votes, num_projects, budget, sorted_counts, num_instances, prop_prob_start, prop_prob_step):
 
-    prop_prob = prop_prob_start
-    cost_instances = []
-    prop_prob_list = []
-
-    for i in range(num_instances):
-        prop_prob = prop_prob - prop_prob_step
-        prop_prob_list.append(round(prop_prob,2))
-        cost_instances.append(create_cost_instance(budget, prop_prob, num_projects, sorted_counts, num_votes))
+    cost_matrix, prop_prob_list = create_cost_matrix_sweep(num_votes, num_projects, budget, sorted_counts, num_instances, prop_prob_start, prop_prob_step)
+    cost_instances = list(iter_cost_instances(budget, cost_matrix))
 
     return cost_instances, prop_prob_list
 
@@ -141,19 +133,22 @@ def histogramm(sorted_counts, cost_instance, num_votes, budget, save_name):
 
 ######
 # saves histograms for all instances
+# the figure is built once per process and only its data is updated (see histogram_rendering)
+# mode: "full" renders all instances, "sampled" every sample_every-th, "off" none
+# num_workers > 1 renders in that many processes
 ######
-def save_histograms(sorted_counts, cost_instances, num_votes, budget, output_dir, prop_prob_list):
+def save_histograms(sorted_counts, cost_instances, num_votes, budget, output_dir, prop_prob_list, mode="full", sample_every=10, num_workers=1):
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    for index, cost_profile in enumerate(cost_instances):
-
-        prop_prob = prop_prob_list[index]
+    project_names = list(cost_instances[0].project_meta)
+    counts = counts_array(sorted_counts, len(project_names))
+    cost_matrix = np.array([[int(instance.project_meta[p]['cost']) for p in project_names] for instance in cost_instances])
 
-        histogram_name = os.path.join(output_dir,f"histogram_{index}_{prop_prob}.png")
+    histogram_names = [os.path.join(output_dir,f"histogram_{index}_{prop_prob_list[index]}.png") for index in range(len(cost_instances))]
 
-        histogramm(sorted_counts, cost_profile, num_votes, budget, histogram_name)
+    return render_all(counts, cost_matrix, num_votes, budget, histogram_names, mode, sample_every, num_workers)
 
 
 #####
@@ -212,30 +207,18 @@ def calc_differences(budget_perc, votes_perc):
 # calculates point biseral coefficients
 #####
 def calc_pbc(profile, instances, s_counts, num_votes):
-    result_pbc_MES = []
-    result_pbc_greedy = []
-
-    sorted_counts = list(s_counts.values())
-
-    for instance in instances:
-        in_outcome_MES = []
-        in_outcome_greedy = []
-        budget_perc = []
-        votes_perc= []
-        diff = []
-        
-        outcome_MES = method_of_equal_shares(instance, profile.as_multiprofile(), sat_class=Cost_Sat, voter_budget_increment=1)
-        
-        outcome_greedy = greedy_utilitarian_welfare(instance, profile.as_multiprofile(), sat_class=Cost_Sat)
+    # the ballots are the same for all instances, only the costs differ
+    project_names = list(instances[0].project_meta)
+    ballot_data = ballot_data_from_profile(profile, project_names)
+    budget = instances[0].budget_limit
+    cost_matrix = np.array([[int(instance.project_meta[p]['cost']) for p in project_names] for instance in instances])
 
-        in_outcome_MES = fill_outcome_array(instance, outcome_MES, in_outcome_MES)
-        in_outcome_greedy = fill_outcome_array(instance, outcome_greedy, in_outcome_greedy)
-        budget_perc = calc_budget_perc(instance, budget_perc)
-        votes_perc = calc_votes_perc(sorted_counts, num_votes)
+    in_outcome_MES = cached_mes_outcomes(ballot_data, cost_matrix, budget)
+    in_outcome_greedy = cached_greedy_outcomes(ballot_data, cost_matrix, budget)
+    budget_perc = cost_matrix / budget
 
-        result_pbc_MES.append(stats.pointbiserialr(in_outcome_MES, budget_perc))
-        
-        result_pbc_greedy.append(stats.pointbiserialr(in_outcome_greedy, budget_perc))
+    result_pbc_MES = list(zip(*point_biserial(in_outcome_MES, budget_perc)))
+    result_pbc_greedy = list(zip(*point_biserial(in_outcome_greedy, budget_perc)))
 
     return result_pbc_MES, result_pbc_greedy
 
@@ -287,26 +270,39 @@ def plot_coefficients(result_pbc_MES, result_pbc_greedy, output_folder, initial_
 
 
 
-def run_election_simulation(num_votes, num_projects, budget, num_profiles, prop_prob_start=1, prop_prob_step=0.025):
-    # 1: create Approval Ballots and Counts for Proportionality
-    created_ballots, sorted_counts = create_ballots(num_votes, num_projects)
-
-    # 2: create all the instances with the differently proportional costs and the probability of proportionality list
-    cost_instances, prop_prob_list = create_list_cost_instances(num_votes, num_projects, budget, sorted_counts, num_profiles, prop_prob_start, prop_prob_step)
-
-    # 3: create the profile
-    profile = create_profile(created_ballots, cost_instances[0])
-
-    # 4: save histograms for the cost instances
-    histograms_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "statistics", f"histograms_{get_current_datetime()}")
-    os.makedirs(histograms_folder, exist_ok=True)
-    save_histograms(sorted_counts, cost_instances, num_votes, budget, histograms_folder, prop_prob_list)
-
-    # 5: save instance files
-    for var in range(len(cost_instances)):
-        instance_file = os.path.join(histograms_folder,f"instance_{str(var)}.pb")
-        write_pabulib(cost_instances[var], profile, instance_file)
-    
-    # 6: calculate and plot coefficients
-    result_pbc_MES, result_pbc_greedy = calc_pbc(profile, cost_instances, sorted_counts, num_votes)
-    plot_coefficients(result_pbc_MES,result_pbc_greedy, histograms_folder, prop_prob_start, prop_prob_step)
+#####
+# histogram_mode/sample_every/num_workers control the histograms of step 4 (see save_histograms)
+# instrument/profile_file: files for the json line events and the cProfile dump of the run (see instrumentation), off if None
+#####
+def run_election_simulation(num_votes, num_projects, budget, num_profiles, prop_prob_start=1, prop_prob_step=0.025, histogram_mode="full", sample_every=10, num_workers=1, instrument=None, profile_file=None):
+    with recording(instrument, profile_file):
+        # 1: create Approval Ballots and Counts for Proportionality
+        with stage('create_ballots'):
+            created_ballots, sorted_counts = create_ballots(num_votes, num_projects)
+
+        # 2: create all the instances with the differently proportional costs and the probability of proportionality list
+        with stage('create_cost_instances'):
+            cost_instances, prop_prob_list = create_list_cost_instances(num_votes, num_projects, budget, sorted_counts, num_profiles, prop_prob_start, prop_prob_step)
+
+        # 3: create the profile
+        with stage('create_profile'):
+            profile = create_profile(created_ballots, cost_instances[0])
+
+        # 4: save histograms for the cost instances
+        histograms_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "statistics", f"histograms_{get_current_datetime()}")
+        os.makedirs(histograms_folder, exist_ok=True)
+        with stage('save_histograms'):
+            save_histograms(sorted_counts, cost_instances, num_votes, budget, histograms_folder, prop_prob_list, histogram_mode, sample_every, num_workers)
+
+        # 5: save instance files
+        with stage('write_instances'):
+            for var in range(len(cost_instances)):
+                instance_file = os.path.join(histograms_folder,f"instance_{str(var)}.pb")
+                write_pabulib(cost_instances[var], profile, instance_file)
+
+        # 6: calculate and plot coefficients
+        with stage('calc_pbc'):
+            result_pbc_MES, result_pbc_greedy = calc_pbc(profile, cost_instances, sorted_counts, num_votes)
+        with stage('plot_coefficients'):
+            plot_coefficients(result_pbc_MES,result_pbc_greedy, histograms_folder, prop_prob_start, prop_prob_step)
+        add_instances(len(cost_instances))
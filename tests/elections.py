@@ -0,0 +1,36 @@
+from cost_matrix import create_cost_matrix
+import numpy as np
+
+
+#####
+# random approval election with the cost model of create_cost_matrix
+#####
+def random_election(rng, num_votes, num_projects, budget, prop_prob):
+    approval_prob = rng.uniform(0.05, 0.6, num_projects)
+    approvals = rng.random((num_votes, num_projects)) < approval_prob
+    counts = approvals.sum(axis=0)
+    costs = create_cost_matrix(budget, [prop_prob], num_projects, counts, num_votes, rng)[0]
+
+    return approvals, costs
+
+
+#####
+# the same election as pabutools instance and multiprofile, project p is named "p<p>"
+#####
+def pabutools_election(approvals, costs, budget):
+    from pabutools.election import Project, ApprovalBallot, ApprovalProfile, Instance
+
+    instance = Instance()
+    instance.budget_limit = budget
+    projects = [Project("p"+str(p), int(costs[p])) for p in range(len(costs))]
+    instance.update(projects)
+
+    profile = ApprovalProfile()
+    for row in approvals:
+        profile.append(ApprovalBallot(projects[p] for p in np.flatnonzero(row)))
+
+    return instance, profile.as_multiprofile()
+
+
+def project_names(selected):
+    return sorted("p"+str(p) for p in selected)
@@ -0,0 +1,27 @@
+from create_many_instances import create_ballots, create_ballot_arrays
+import numpy as np
+import pytest
+
+
+#####
+# the ballot arrays hold the same ballots as the sets of create_ballots, also below 8 projects
+# where the central votes of the disjoint resampling model are empty
+#####
+@pytest.mark.parametrize("num_projects", [3, 5, 7, 8, 20])
+def test_ballot_arrays_match_ballots(num_projects):
+    ballots, sorted_counts = create_ballots(200, num_projects, seed=1)
+    ballot_data = create_ballot_arrays(200, num_projects, seed=1)
+
+    assert ballot_data.num_votes == 200
+    assert {p: int(c) for p, c in enumerate(ballot_data.counts) if c} == sorted_counts
+    assert [sorted(ballot_data.indices[ballot_data.indptr[v]:ballot_data.indptr[v + 1]]) for v in range(200)] == [sorted(b) for b in ballots]
+
+
+@pytest.mark.parametrize("num_projects", [5, 20])
+def test_chunked_ballot_arrays(num_projects):
+    ballot_data = create_ballot_arrays(230, num_projects, seed=2, chunk_size=50)
+
+    assert ballot_data.num_votes == 230
+    assert len(ballot_data.indptr) == 231
+    assert ballot_data.counts.sum() == len(ballot_data.indices)
+    assert np.all(ballot_data.indices < num_projects)
@@ -0,0 +1,48 @@
+from elections import random_election, pabutools_election, project_names
+from greedy_engine import greedy_cost_sat, greedy_utilitarian_welfare_fast
+import numpy as np
+import pytest
+
+
+#####
+# every cost variant of random elections against pabutools' greedy_utilitarian_welfare
+#####
+@pytest.mark.parametrize("budget", [20000, 10**8])
+def test_greedy_matches_pabutools(budget):
+    from pabutools.election import Cost_Sat
+    from pabutools.rules import greedy_utilitarian_welfare
+
+    rng = np.random.default_rng(0)
+    for trial in range(30):
+        approvals, _ = random_election(rng, 40, 8, budget, 1)
+        cost_matrix = np.array([random_election(rng, 40, 8, budget, rng.random())[1] for var in range(5)])
+        selected = greedy_cost_sat(approvals.sum(axis=0), cost_matrix, budget)
+
+        for var, costs in enumerate(cost_matrix):
+            instance, profile = pabutools_election(approvals, costs, budget)
+            expected = greedy_utilitarian_welfare(instance, profile, sat_class=Cost_Sat)
+
+            assert project_names(np.flatnonzero(selected[var])) == sorted(p.name for p in expected), f"trial {trial}, var {var}"
+
+
+def test_fast_wrapper_matches_pabutools():
+    from pabutools.election import Cost_Sat
+    from pabutools.rules import greedy_utilitarian_welfare
+
+    rng = np.random.default_rng(1)
+    for trial in range(10):
+        approvals, costs = random_election(rng, 30, 10, 20000, rng.random())
+        instance, profile = pabutools_election(approvals, costs, 20000)
+
+        expected = greedy_utilitarian_welfare(instance, profile, sat_class=Cost_Sat)
+        outcome = greedy_utilitarian_welfare_fast(instance, profile)
+
+        assert sorted(p.name for p in outcome) == sorted(p.name for p in expected), f"trial {trial}"
+
+
+def test_fast_wrapper_rejects_other_satisfactions():
+    from pabutools.election import Cardinality_Sat
+
+    instance, profile = pabutools_election(np.ones((2, 2), dtype=bool), [1, 1], 2)
+    with pytest.raises(ValueError):
+        greedy_utilitarian_welfare_fast(instance, profile, sat_class=Cardinality_Sat)
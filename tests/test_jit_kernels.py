@@ -0,0 +1,117 @@
+from elections import random_election, pabutools_election, project_names
+from ballot_data import ballot_data_from_csr, ballots_to_csr, packed_approvals
+from mes_engine import ballot_types, mes_cost_sat, mes_rounds, lexico_ranks, default_project_names
+from greedy_engine import greedy_cost_sat
+import jit_kernels
+import numpy as np
+import pytest
+
+
+#####
+# runs a test once on the NumPy engines and once on the compiled kernels
+# the compiled run is skipped when numba is not installed
+#####
+@pytest.fixture(params=[False, True], ids=["numpy", "numba"])
+def kernels(request, monkeypatch):
+    if request.param:
+        pytest.importorskip("numba")
+    monkeypatch.setattr(jit_kernels, "enabled", request.param)
+
+    return request.param
+
+
+@pytest.mark.parametrize("completion", ["jump", "increment"])
+def test_mes_matches_pabutools(kernels, completion):
+    from pabutools.election import Cost_Sat
+    from pabutools.rules import method_of_equal_shares
+
+    rng = np.random.default_rng(0)
+    for trial in range(30):
+        approvals, costs = random_election(rng, 40, 8, 20000, rng.random())
+        instance, profile = pabutools_election(approvals, costs, 20000)
+        expected = method_of_equal_shares(instance, profile, sat_class=Cost_Sat, voter_budget_increment=1)
+
+        types, multiplicities = ballot_types(approvals)
+        outcome = mes_cost_sat(types, multiplicities, costs, 20000, voter_budget_increment=1, completion=completion)
+
+        assert project_names(outcome) == sorted(p.name for p in expected), f"trial {trial}"
+
+
+def test_greedy_matches_pabutools(kernels):
+    from pabutools.election import Cost_Sat
+    from pabutools.rules import greedy_utilitarian_welfare
+
+    rng = np.random.default_rng(0)
+    for trial in range(30):
+        approvals, costs = random_election(rng, 40, 8, 20000, rng.random())
+        instance, profile = pabutools_election(approvals, costs, 20000)
+        expected = greedy_utilitarian_welfare(instance, profile, sat_class=Cost_Sat)
+
+        selected = greedy_cost_sat(approvals.sum(axis=0), costs, 20000)[0]
+
+        assert project_names(np.flatnonzero(selected)) == sorted(p.name for p in expected), f"trial {trial}"
+
+
+def test_ballot_data_matches_numpy(kernels):
+    rng = np.random.default_rng(0)
+    approvals = rng.random((500, 13)) < 0.3
+    indptr, indices = ballots_to_csr([np.flatnonzero(row) for row in approvals])
+
+    ballot_data = ballot_data_from_csr(indptr, indices, 13)
+    types, multiplicities = ballot_types(approvals)
+
+    np.testing.assert_array_equal(ballot_data.counts, approvals.sum(axis=0))
+    np.testing.assert_array_equal(ballot_data.types, types)
+    np.testing.assert_array_equal(ballot_data.multiplicities, multiplicities)
+
+
+#####
+# the compiled kernels against the NumPy code they replace, breakpoints included
+#####
+def test_pack_approvals_kernel():
+    pytest.importorskip("numba")
+
+    rng = np.random.default_rng(1)
+    approvals = rng.random((300, 21)) < 0.4
+    indptr, indices = ballots_to_csr([np.flatnonzero(row) for row in approvals])
+
+    packed, counts = jit_kernels.pack_approvals(indptr, indices, 21)
+
+    np.testing.assert_array_equal(packed, packed_approvals(indptr, indices, 21))
+    np.testing.assert_array_equal(counts, np.bincount(indices, minlength=21))
+
+
+def test_mes_rounds_kernel_breakpoints(monkeypatch):
+    pytest.importorskip("numba")
+
+    rng = np.random.default_rng(2)
+    name_ranks = lexico_ranks(default_project_names(8))
+    for trial in range(30):
+        approvals, costs = random_election(rng, 40, 8, 20000, rng.random())
+        types, multiplicities = ballot_types(approvals)
+        candidates = approvals.any(axis=0) & (costs > 0)
+        voter_budget = 20000 / 40 * rng.uniform(1, 3)
+
+        results = {}
+        for enabled in (False, True):
+            monkeypatch.setattr(jit_kernels, "enabled", enabled)
+            results[enabled] = mes_rounds(types, multiplicities, costs, voter_budget, name_ranks, candidates, track=True)
+
+        assert results[True][0] == results[False][0], f"trial {trial}"
+        np.testing.assert_allclose(results[True][1], results[False][1], rtol=1e-9, err_msg=f"trial {trial}")
+
+
+def test_greedy_kernel_many_variants(monkeypatch):
+    pytest.importorskip("numba")
+
+    rng = np.random.default_rng(3)
+    approvals, _ = random_election(rng, 60, 15, 500000, 1)
+    cost_matrix = np.array([random_election(rng, 60, 15, 500000, p)[1] for p in np.linspace(0, 1, 12)])
+    counts = approvals.sum(axis=0)
+
+    selected = {}
+    for enabled in (False, True):
+        monkeypatch.setattr(jit_kernels, "enabled", enabled)
+        selected[enabled] = greedy_cost_sat(counts, cost_matrix, 500000)
+
+    np.testing.assert_array_equal(selected[True], selected[False])
@@ -0,0 +1,77 @@
+from elections import random_election, pabutools_election, project_names
+from mes_engine import ballot_types, mes_cost_sat, method_of_equal_shares_fast
+import numpy as np
+import pytest
+
+# budget and voter_budget_increment, the increment grows with the budget so pabutools stays fast
+CASES = [(20000, 1), (20000, None), (10**6, 100), (10**8, 10**4), (10**8, None)]
+
+
+#####
+# random elections against pabutools' method_of_equal_shares with Cost_Sat
+#####
+@pytest.mark.parametrize("completion", ["jump", "increment"])
+@pytest.mark.parametrize("budget, voter_budget_increment", CASES)
+def test_mes_matches_pabutools(budget, voter_budget_increment, completion):
+    from pabutools.election import Cost_Sat
+    from pabutools.rules import method_of_equal_shares
+
+    if voter_budget_increment is None and completion == "increment":
+        pytest.skip("the completion is only used with voter_budget_increment")
+
+    rng = np.random.default_rng(0)
+    for trial in range(30):
+        approvals, costs = random_election(rng, 40, 8, budget, rng.random())
+        instance, profile = pabutools_election(approvals, costs, budget)
+        expected = method_of_equal_shares(instance, profile, sat_class=Cost_Sat, voter_budget_increment=voter_budget_increment)
+
+        types, multiplicities = ballot_types(approvals)
+        outcome = mes_cost_sat(types, multiplicities, costs, budget, voter_budget_increment=voter_budget_increment, completion=completion)
+
+        assert project_names(outcome) == sorted(p.name for p in expected), f"trial {trial}"
+
+
+#####
+# projects that cost nothing are never selected by pabutools under Cost_Sat, random_election has none
+#####
+@pytest.mark.parametrize("completion", ["jump", "increment"])
+@pytest.mark.parametrize("voter_budget_increment", [1, None])
+def test_free_projects_match_pabutools(voter_budget_increment, completion):
+    from pabutools.election import Cost_Sat
+    from pabutools.rules import method_of_equal_shares
+
+    approvals = np.array([[1, 1, 0], [0, 1, 1], [1, 0, 1]], dtype=bool)
+    types, multiplicities = ballot_types(approvals)
+    assert mes_cost_sat(types, multiplicities, [0, 60, 60], 100, voter_budget_increment=voter_budget_increment, completion=completion) == [1]
+
+    rng = np.random.default_rng(5)
+    for trial in range(30):
+        approvals, costs = random_election(rng, 30, 8, 20000, rng.random())
+        costs[rng.random(8) < 0.3] = 0
+        instance, profile = pabutools_election(approvals, costs, 20000)
+        expected = method_of_equal_shares(instance, profile, sat_class=Cost_Sat, voter_budget_increment=voter_budget_increment)
+
+        types, multiplicities = ballot_types(approvals)
+        outcome = mes_cost_sat(types, multiplicities, costs, 20000, voter_budget_increment=voter_budget_increment, completion=completion)
+
+        assert project_names(outcome) == sorted(p.name for p in expected), f"trial {trial}"
+
+
+def test_fast_wrapper_matches_pabutools():
+    from pabutools.election import Cost_Sat
+    from pabutools.rules import method_of_equal_shares
+
+    rng = np.random.default_rng(1)
+    for trial in range(10):
+        approvals, costs = random_election(rng, 30, 10, 20000, rng.random())
+        instance, profile = pabutools_election(approvals, costs, 20000)
+
+        expected = method_of_equal_shares(instance, profile, sat_class=Cost_Sat, voter_budget_increment=1)
+        outcome = method_of_equal_shares_fast(instance, profile, voter_budget_increment=1)
+
+        assert sorted(p.name for p in outcome) == sorted(p.name for p in expected), f"trial {trial}"
+
+
+def test_unknown_completion():
+    with pytest.raises(ValueError):
+        mes_cost_sat(np.ones((1, 2), dtype=bool), [1], [1, 1], 2, completion="bisect")
@@ -0,0 +1,50 @@
+from pbc_engine import point_biserial
+import scipy.stats as stats
+import numpy as np
+import warnings
+import pytest
+
+
+def scipy_point_biserial(outcomes, covariates):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return np.array([stats.pointbiserialr(x, y) for x, y in zip(outcomes, covariates)]).reshape(-1, 2)
+
+
+#####
+# random outcomes against scipy.stats.pointbiserialr row by row
+# rows 0-2 are degenerate: nothing selected, everything selected, constant covariate
+#####
+@pytest.mark.parametrize("num_projects", [2, 3, 20, 100])
+def test_matches_scipy(num_projects):
+    rng = np.random.default_rng(0)
+    outcomes = rng.random((200, num_projects)) < rng.random((200, 1))
+    outcomes[0] = False
+    outcomes[1] = True
+    covariates = rng.random((200, num_projects))
+    covariates[2] = 0.5
+
+    r, p = point_biserial(outcomes, covariates)
+    expected = scipy_point_biserial(outcomes, covariates)
+
+    np.testing.assert_array_equal(np.isnan(r), np.isnan(expected[:, 0]))
+    np.testing.assert_array_equal(np.isnan(p), np.isnan(expected[:, 1]))
+    np.testing.assert_allclose(r, expected[:, 0], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(p, expected[:, 1], rtol=0, atol=1e-12)
+
+
+def test_broadcasts_a_single_covariate_row():
+    rng = np.random.default_rng(1)
+    outcomes = rng.random((50, 10)) < 0.5
+    covariates = rng.random(10)
+
+    r, p = point_biserial(outcomes, covariates)
+    expected = scipy_point_biserial(outcomes, np.broadcast_to(covariates, outcomes.shape))
+
+    np.testing.assert_allclose(r, expected[:, 0], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(p, expected[:, 1], rtol=0, atol=1e-12)
+
+
+def test_needs_two_projects():
+    with pytest.raises(ValueError):
+        point_biserial([[True]], [[1.0]])
@@ -0,0 +1,46 @@
+from shard_manifest import create_manifest, lock_path, result_path, try_claim, run_worker
+import os
+import time
+
+
+def age_file(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+#####
+# a worker that crashed mid shard leaves its lock and its partial results behind
+# the worker taking the shard over removes the partial results, a fresh tmp file is left alone
+#####
+def test_takeover_removes_partial_results(tmp_path):
+    folder = str(tmp_path)
+    manifest = create_manifest(folder, 2, 1, 50, 5, 100000, 3, seed=1)
+    shard = manifest['shards'][0]
+
+    assert try_claim(folder, shard, "crashed", 60) is not None
+    crashed_tmp = result_path(folder, shard) + ".crashed.tmp"
+    fresh_tmp = result_path(folder, shard) + ".fresh.tmp"
+    for path in (crashed_tmp, fresh_tmp):
+        with open(path, 'w') as f:
+            f.write("partial")
+    age_file(lock_path(folder, shard), 120)
+    age_file(crashed_tmp, 120)
+
+    assert try_claim(folder, shard, "taker", 60) is not None
+    assert not os.path.exists(crashed_tmp)
+    assert os.path.exists(fresh_tmp)
+
+
+def test_worker_leaves_no_tmp_files(tmp_path):
+    folder = str(tmp_path)
+    manifest = create_manifest(folder, 2, 1, 50, 5, 100000, 3, seed=1)
+    shard = manifest['shards'][1]
+
+    assert try_claim(folder, shard, "crashed", 60) is not None
+    with open(result_path(folder, shard) + ".crashed.tmp", 'w') as f:
+        f.write("partial")
+    age_file(lock_path(folder, shard), 120)
+    age_file(result_path(folder, shard) + ".crashed.tmp", 120)
+
+    assert sorted(run_worker(folder, lease_seconds=60)) == [0, 1]
+    assert sorted(os.listdir(os.path.join(folder, "results"))) == ["shard_0.csv", "shard_1.csv"]